@@ -2,6 +2,7 @@
 Fit (any) datafile.
 """
 from ..common import datafile
+from ..common import sweeparray
 from . import jjivarray2
 from . import jj_curves
 from scipy.optimize import curve_fit
@@ -55,7 +56,16 @@ def fit_IarrVarr_RSJ(data, md=None, **kwargs):
     return datao, md
 
 def fit_BIV_RSJ(data, md=None, **kwargs):
-    """Fit IVs to RSJ model and return fit parameter arrays as data dict."""
+    """Fit IVs to RSJ model and return fit parameter arrays as data dict.
+
+    Keyword arguments:
+        npts: Int. Points per IV. Needed for an aborted sweep (short last
+            IV, which is then not fitted). Default: from the lengths.
+        jobs: Int. Fit in parallel processes (see jjivarray2.fit2rsj_arr).
+            Default 1.
+        method: "chain" (default) or "batched" (all IVs at once; see
+            jjivarray2.fit2rsj_arr).
+    """
     func = lambda _i, icp, icn, r, vo: \
             jj_curves.V_RSJ_asym(_i, icp, icn, r, 0, vo)
     kwargs2 = {}
@@ -68,16 +78,21 @@ def fit_BIV_RSJ(data, md=None, **kwargs):
     else:
         kwargs2['updateguess'] = 0.8
         print('Default updateguess =', kwargs2['updateguess'])
+    kwargs2['jobs'] = kwargs.get('jobs', 1)
+    kwargs2['method'] = kwargs.get('method', 'chain')
 
     #Iarr, Varr = data["Iarr"], data["Varr"]
-    # Separate I and V and deserialize multi-D data
-    data['I'], data['V'] = data['IV'][:, 0], data['IV'][:, 1]
-    tmp = datafile.deserialize_data(data, ['B'], ['I', 'V'])
-    Iarr, Varr = tmp['I'], tmp['V']
-    #print('Iarr, Varr:', Iarr, Varr)
-    #Iarr, Varr = IVarr[:, 0], IVarr[:, 1]
-
-    popt_arr, pcov_arr = jjivarray2.fit2rsj_arr(Iarr, Varr, **kwargs2)
+    # View complete IVs as (B, sample, col) without copying; split I and V.
+    # An aborted sweep leaves a short last IV, which is not fitted.
+    iv = sweeparray.SweepArray.from_flat(data['IV'], [('B', data['B'])],
+                                         npts=kwargs.get('npts', None),
+                                         partial='drop')
+    Iarr, Varr = iv.values[..., 0], iv.values[..., 1]
+    data['I'] = data['IV'][:, 0]
+
+    popt_arr = np.full((len(data['B']), 4), np.nan)
+    popt_arr[:len(iv)], pcov_arr = jjivarray2.fit2rsj_arr(Iarr, Varr,
+                                                          **kwargs2)
 
     # Build a new data ordereddict with fit parameters
     datao = OrderedDict()
@@ -111,7 +126,8 @@ def fit_BIc_Airypat(data, md=None, **param):
     Bmax        = np.max(x)
     Bnod0       = param.get("Bnod0", Bcen0 + (Bmax - Bcen0)*0.7)
     guess       = [Ic0, Bcen0, Bnod0]
-    popt, pcov  = curve_fit(func, x, y, guess)
+    popt, pcov  = curve_fit(func, x, y, guess,
+                            jac=jj_curves.airypat_easy_jac)
     Rn          = np.mean(data['Rn'])   # often needed for IcRn eval
     datao       = OrderedDict([("Icp", popt[0]), ("Bcen", popt[1]),
                                ("Bnod", popt[2]), ('Rn', Rn)])
@@ -121,27 +137,8 @@ def fit_BIc_Airypat(data, md=None, **param):
     md["fitx_nosave"]      = x
     return datao, md
 
-def fit_datafile(fi, **kwargs):
-    """Fit datafile. Try to infer user's intention by context.
-
-    Arguments:
-        fi: Datafile
-    Keyword arguments:
-        fo: Output filename. Default: fi.
-        model: Fit model. Default: RSJ.
-        The rest is handed over to the called fitting function.
-    Return:
-        data, md, fit_function
-    """
-    # Find intention
-    intention   = _get_fit_intention(fi, **kwargs)
-    head, tail  = os.path.split(fi)
-    root, ext   = os.path.splitext(tail)
-    fo          = kwargs.get("fo", os.path.join(head, "{}_{}{}".format(
-                  intention["model"], root, ext)))
-
-    data, md    = datafile.load_data(fi)
-
+def _fit_and_save(data, md, intention, fo, **kwargs):
+    """Run the fit function chosen by intention and save array results."""
     # Choose and run proper fit function
     if intention["data"] == "BIarrVarr_JJ":
         if intention["model"]   == "RSJ":
@@ -160,3 +157,35 @@ def fit_datafile(fi, **kwargs):
         datafile.save_data(fo, datao, md=md)
 
     return datao, md
+
+def fit_datafile(fi, **kwargs):
+    """Fit datafile. Try to infer user's intention by context.
+
+    Arguments:
+        fi: Datafile, or a list of datafiles continuing one sweep (fitted
+            as one; see datafile.VirtualData).
+    Keyword arguments:
+        fo: Output filename. Default: fi (the first one for a list).
+        model: Fit model. Default: RSJ.
+        jobs: Number of processes for array fits. Default 1.
+        mmap_mode: Memory-map uncompressed .npy members (see load_data).
+        cache: Bool. Reuse data parsed by earlier calls (see load_data).
+        The rest is handed over to the called fitting function.
+    Return:
+        data, md, fit_function
+    """
+    # Find intention
+    fi0         = fi if isinstance(fi, str) else datafile.find_datafiles(fi)[0]
+    intention   = _get_fit_intention(fi0, **kwargs)
+    head, tail  = os.path.split(fi0)
+    root, ext   = os.path.splitext(tail)
+    fo          = kwargs.pop("fo", os.path.join(head, "{}_{}{}".format(
+                  intention["model"], root, ext)))
+
+    if kwargs.get("cache", False) and isinstance(fi, str):
+        data, md = datafile.load_data(fi, cache=True)
+        return _fit_and_save(data, md, intention, fo, **kwargs)
+
+    # Members are read only as the fit function asks for them.
+    with datafile.open_data(fi, mmap_mode=kwargs.get("mmap_mode")) as data:
+        return _fit_and_save(data, data.md, intention, fo, **kwargs)
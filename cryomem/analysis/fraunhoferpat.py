@@ -3,6 +3,7 @@ import numpy as np
 from scipy.optimize import curve_fit
 from scipy.special import jn
 from ..common.datacondition import deglitch
+from .jj_curves import airypat_jac
 
 class FraunhoferPat:
     """Fraunhofer pattern data fitter (single-valued)"""
@@ -15,8 +16,20 @@ class FraunhoferPat:
         """Return Fraunhofer f(x) = p0*|sinc(p1(x - p2))|"""
         return p[0]*abs(np.sinc(p[1]*(x - p[2])))
 
+    def jac(self, x, *p):
+        """Return d func/d(p0, p1, p2), shape (len(x), 3).
+
+        d sinc(w)/dw = (cos(pi w) - sinc(w))/w, 0 at w = 0.
+        """
+        w = p[1]*(x - p[2])
+        s = np.sinc(w)
+        ds = np.where(w == 0, 0, (np.cos(np.pi*w) - s)/np.where(w == 0, 1, w))
+        dfdw = p[0]*np.sign(s)*ds
+        return np.column_stack([np.abs(s), dfdw*(x - p[2]), -dfdw*p[1]])
+
     def fit(self, guess = [1, 1, 0]):
-        self.p, self.pcov = curve_fit(self.func, self.x, self.y, guess)
+        self.p, self.pcov = curve_fit(self.func, self.x, self.y, guess,
+                                      jac=self.jac)
         return self.p, self.pcov
 
     def build_curve(self, **kwargs):
@@ -44,3 +57,7 @@ class AiryPat(FraunhoferPat):
         """Return Airy f(x) = p0*|J1(pi*p1(x - p2))/(pi*p1(x - p2))|."""
         return p[0]*abs(2*jn(1, np.pi*p[1]*(x - p[2]))\
             /(abs(np.pi*p[1]*(x - p[2]) + 1e-20)))  # bypass divide by 0
+
+    def jac(self, x, *p):
+        """Return d func/d(p0, p1, p2). See jj_curves.airypat_jac."""
+        return airypat_jac(x, *p)
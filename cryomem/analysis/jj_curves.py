@@ -1,6 +1,7 @@
 """Fit curve definitions for JJs"""
 import numpy as np
 from scipy.special import jn
+from . import jjiv2
 
 def airypat(x, *p):
     """Return Airy f(x) = p0*|J1(pi*p1(x - p2))/(pi*p1(x - p2))|."""
@@ -8,6 +9,20 @@ def airypat(x, *p):
     return p[0]*abs(2*jn(1, np.pi*p[1]*(x - p[2]))\
         /(abs(np.pi*p[1]*(x - p[2]) + 1e-20)))  # bypass divide by 0
 
+def airypat_jac(x, *p):
+    """Return d airypat/d(p0, p1, p2), shape (len(x), 3).
+
+    With g(u) = 2 J1(u)/|u| as in airypat, dg/du = -2 J2(u)/|u| (Bessel
+    recurrence J0 + J2 = 2 J1/u).
+    """
+    x = np.asarray(x, dtype=float)
+    u = np.pi*p[1]*(x - p[2])
+    au = np.abs(u) + 1e-20
+    g = 2*jn(1, u)/au
+    dfdu = -p[0]*np.sign(g)*2*jn(2, u)/au
+    return np.column_stack([np.abs(g), dfdu*np.pi*(x - p[2]),
+                            -dfdu*np.pi*p[1]])
+
 def airypat_easy(x, *p):
     """Return Airy pattern defined by Ic, Hcen, Hnode.
 
@@ -17,6 +32,15 @@ def airypat_easy(x, *p):
     p1 = 3.81/np.pi/(np.abs(p[1] - p[2]))
     return airypat(x, p[0], p1, p[1])
 
+def airypat_easy_jac(x, *p):
+    """Return d airypat_easy/d(Ic, Hcenter, Hnode), shape (len(x), 3)."""
+    d = p[1] - p[2]
+    p1 = 3.81/np.pi/np.abs(d)
+    dp1 = -3.81/np.pi*np.sign(d)/d**2          # d p1/d Hcenter
+    jac = airypat_jac(x, p[0], p1, p[1])
+    return np.column_stack([jac[:, 0], jac[:, 1]*dp1 + jac[:, 2],
+                            -jac[:, 1]*dp1])
+
 def V_RSJ_asym(i, ic_pos, ic_neg, rn, io, vo):
     """Return voltage with asymmetric Ic's in RSJ model"""
     if ic_pos < 0 or ic_neg > 0 or rn < 0:
@@ -30,3 +54,10 @@ def V_RSJ_asym(i, ic_pos, ic_neg, rn, io, vo):
         n = i<io+ic_neg; v[n] = -rn*np.sqrt((i[n]-io)**2-ic_neg**2)+vo
         n = np.logical_and(i>=io+ic_neg, i<=io+ic_pos); v[n]=vo
     return v
+
+def V_RSJ_asym_jac(i, ic_pos, ic_neg, rn, io, vo, di=0):
+    """Return d V_RSJ_asym/d(ic_pos, ic_neg, rn, io, vo), shape (len(i), 5).
+
+    See jjiv2.v_rsj_asym_jac.
+    """
+    return jjiv2.v_rsj_asym_jac(i, ic_pos, ic_neg, rn, io, vo, di)
@@ -33,6 +33,55 @@ def v_rsj_asym(i, ic_pos, ic_neg, rn, io, vo):
         n = np.logical_and(i>=io+ic_neg, i<=io+ic_pos); v[n]=vo
     return v
 
+def _sqrt_branches(x, ic_pos, ic_neg):
+    """Return sqrt(x**2 - ic**2) on the upper and lower branch (0 elsewhere)."""
+    sp = np.sqrt(np.maximum(x**2 - ic_pos**2, 0)*(x > ic_pos))
+    sn = np.sqrt(np.maximum(x**2 - ic_neg**2, 0)*(x < ic_neg))
+    return sp, sn
+
+def v_rsj_asym_jac(i, ic_pos, ic_neg, rn, io, vo, di=0):
+    """Return d v_rsj_asym/d(ic_pos, ic_neg, rn, io, vo), shape (len(i), 5).
+
+    The Ic and Io derivatives diverge at the switching points; the square
+    roots there are floored at di (e.g. the current step of the IV).
+    """
+    x = np.asarray(i, dtype=float) - io
+    sp, sn = _sqrt_branches(x, ic_pos, ic_neg)
+    rp = (sp > 0)/np.maximum(sp, max(di, 1e-300))  # 1/sqrt on the branch
+    rm = (sn > 0)/np.maximum(sn, max(di, 1e-300))
+    jac = np.empty((len(x), 5))
+    jac[:, 0] = -rn*ic_pos*rp
+    jac[:, 1] = rn*ic_neg*rm
+    jac[:, 2] = sp - sn
+    jac[:, 3] = -rn*x*(rp - rm)
+    jac[:, 4] = 1
+    return jac
+
+def v_rsj_jac(i, ic, rn, io, vo, di=0):
+    """Return d v_rsj/d(ic, rn, io, vo), shape (len(i), 4). See
+    v_rsj_asym_jac."""
+    jac = v_rsj_asym_jac(i, ic, -ic, rn, io, vo, di)
+    return np.column_stack([jac[:, 0] - jac[:, 1], jac[:, 2:]])
+
+def quickguess_rsj(i, v, model='rsj_asym'):
+    """Return a rough [ic, rn, vo] or [ic, -ic, rn, vo] from an IV."""
+    imax = max(i)
+    idx = abs(i) < 0.1*imax
+    vo = np.mean(v[idx])                    # vo guess
+
+    vmax = max(v)
+    idx = abs(v - vo) < 0.1*(vmax - vo)
+    ic = (np.max(i[idx]) - np.min(i[idx]))/2    # ic guess
+
+    #idx = i > imax/2
+    idx = (v - vo) > (vmax - vo)/2
+    rn = np.polyfit(i[idx], v[idx], 1)[0]   # rn guess
+
+    if model == 'rsj':
+        return [ic, rn, vo]
+    if model == 'rsj_asym':
+        return [ic, -ic, rn, vo]
+
 def fit2rsj(i, v, **kwargs):
     """Fit with v_rsj or v_rsj_asym. Fix Io.
     Initial guess=[ic, rn, vo] or [ic_pos, ic_neg, rn, vo]
@@ -45,33 +94,23 @@ def fit2rsj(i, v, **kwargs):
     if 'guess' in kwargs:
         guess = kwargs['guess']
     else:
-        # quick guess
-        imax = max(i)
-        idx = abs(i) < 0.1*imax
-        vo = np.mean(v[idx])                    # vo guess
-
-        vmax = max(v)
-        idx = abs(v - vo) < 0.1*(vmax - vo)
-        ic = (np.max(i[idx]) - np.min(i[idx]))/2    # ic guess
-
-        #idx = i > imax/2
-        idx = (v - vo) > (vmax - vo)/2
-        rn = np.polyfit(i[idx], v[idx], 1)[0]   # rn guess
-
-        if model == 'rsj':
-            guess = [ic, rn, vo] 
-        if model == 'rsj_asym':
-            guess = [ic, -ic, rn, vo] 
+        guess = quickguess_rsj(i, v, model)
         print('Quick guess:', guess)
 
-    # fit with function with fixed io
+    # fit with function with fixed io and its analytic jacobian
+    di = np.median(np.abs(np.diff(i)))
     if model == 'rsj':
         _v = lambda _i, ic, r, vo: v_rsj(_i, ic, r, io, vo)
+        _jac = lambda _i, ic, r, vo: \
+            v_rsj_jac(_i, ic, r, io, vo, di)[:, [0, 1, 3]]
     if model == 'rsj_asym':
         _v = lambda _i, icp, icn, r, vo: v_rsj_asym(_i, icp, icn, r, io, vo)
+        _jac = lambda _i, icp, icn, r, vo: \
+            v_rsj_asym_jac(_i, icp, icn, r, io, vo, di)[:, [0, 1, 2, 4]]
     #popt, pcov = curve_fit(_v, i, v, guess)
     bounds = ([0,-np.inf,-np.inf,-np.inf],[np.inf,0,np.inf,np.inf])
-    popt, pcov = curve_fit(_v, i, v, guess, bounds=bounds, method='trf')
+    popt, pcov = curve_fit(_v, i, v, guess, bounds=bounds, method='trf',
+                           jac=_jac)
 
     # if Ic is too low, narrow range and re-fit.
     #icp, icn, r, v0 = popt
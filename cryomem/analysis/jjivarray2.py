@@ -6,18 +6,12 @@ BB, 2016
 
 import numpy as np
 from . import jjiv2 as jjiv
-import sys
+import os, sys
+from concurrent.futures import ProcessPoolExecutor
 
-def fit2rsj_arr(iarr, varr, **kwargs):
-    """Fit IV array to 2 Ic RSJ model and return arrays of fit params, error.
-
-    Keyword arguments:
-    guess: array of (Ic+, Ic-, Rn, Vo)
-    io: fixed Io.
-    updateguess: guess update ratio 0 to 1
-    """
-    if 'guess' in kwargs:
-        kwargs['guess'] = np.array(kwargs['guess']) # array type
+def _fit2rsj_chain(iarr, varr, kwargs):
+    """Fit IVs in order, each seeded by the previous fits (warm start)."""
+    kwargs = dict(kwargs)
     update = kwargs.get('updateguess', 0.95)
 
     n = len(iarr)
@@ -52,3 +46,193 @@ def fit2rsj_arr(iarr, varr, **kwargs):
 
     return popt_arr, pcov_arr
 
+def quickguess_rsj_arr(iarr, varr):
+    """Return rough (Ic, -Ic, Rn, Vo) of every IV of an (N, npts) array.
+
+    Row k equals jjiv2.quickguess_rsj(iarr[k], varr[k]) (model rsj_asym),
+    computed for all curves at once with masked reductions: Vo is the mean
+    V at |I| < 0.1 Imax, Ic is half the I range of the flat region
+    |V - Vo| < 0.1 (Vmax - Vo), and Rn is the least-squares slope of the
+    upper half of the V range. Fast enough to screen IVs during
+    acquisition. Return: (N, 4) array. Curves without points in a region
+    get NaN.
+    """
+    i = np.atleast_2d(np.asarray(iarr, dtype=float))
+    v = np.atleast_2d(np.asarray(varr, dtype=float))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        imax = np.nanmax(i, axis=1, keepdims=True)
+        low  = np.abs(i) < 0.1*imax
+        vo   = (np.where(low, v, 0).sum(axis=1, keepdims=True)
+                / low.sum(axis=1, keepdims=True))
+        vmax = np.nanmax(v, axis=1, keepdims=True)
+        flat = np.abs(v - vo) < 0.1*(vmax - vo)
+        icp  = np.where(flat, i, -np.inf).max(axis=1)
+        icn  = np.where(flat, i, np.inf).min(axis=1)
+
+        # slope by closed-form linear regression over the mask
+        high = (v - vo) > (vmax - vo)/2
+        n    = high.sum(axis=1)
+        si   = np.where(high, i, 0).sum(axis=1)
+        sv   = np.where(high, v, 0).sum(axis=1)
+        sii  = np.where(high, i*i, 0).sum(axis=1)
+        siv  = np.where(high, i*v, 0).sum(axis=1)
+        rn   = (n*siv - si*sv)/(n*sii - si*si)
+
+    ic    = (icp - icn)/2
+    guess = np.column_stack([ic, -ic, rn, vo[:, 0]])
+    guess[~np.isfinite(guess)] = np.nan
+    return guess
+
+def _rsj_asym_batch(x, p, di):
+    """Return v_rsj_asym and its Jacobian for all curves at once.
+
+    x: (N, M) current minus io. p: (N, 4) rows of (Ic+, Ic-, Rn, Vo).
+    di: (N, 1) sample spacing; the square roots are floored there so the
+        Jacobian stays finite at the switching points.
+    Return: v (N, M), jac (N, M, 4)
+    """
+    icp, icn, rn, vo = (p[:, k:k+1] for k in range(4))
+    x2 = x*x
+    sp = np.sqrt(np.maximum(x2 - icp*icp, 0)*(x > icp))
+    sn = np.sqrt(np.maximum(x2 - icn*icn, 0)*(x < icn))
+    jac = np.empty((4,) + x.shape)
+    np.subtract(sp, sn, out=jac[2])
+    v = vo + rn*jac[2]
+    np.multiply(-rn*icp, (sp > 0)/np.maximum(sp, di), out=jac[0])
+    np.multiply(rn*icn, (sn > 0)/np.maximum(sn, di), out=jac[1])
+    jac[3] = 1
+    return v, jac.transpose(1, 2, 0)
+
+def fit2rsj_batched(iarr, varr, guess, io=0, maxiter=200, ftol=1e-8,
+                    xtol=1e-8):
+    """Fit all IVs to v_rsj_asym at once by batched Levenberg-Marquardt.
+
+    Parameters of all N curves are iterated together as an (N, 4) array,
+    each curve with its own damping; converged curves drop out. Non-finite
+    samples (e.g. a masked, short last IV) are ignored.
+
+    Arguments:
+        iarr, varr: (N, M) arrays.
+        guess: (4,) or (N, 4) initial (Ic+, Ic-, Rn, Vo).
+    Return:
+        popt_arr (N, 4), pcov_arr (N, 4, 4) as in fit2rsj_arr: pcov is
+        inv(J^T J)*SSR/(m - 4). Curves that do not give a finite fit are
+        left 0 (like failed fits in fit2rsj_arr).
+    """
+    iarr = np.asarray(iarr, dtype=float)
+    varr = np.asarray(varr, dtype=float)
+    n, m = iarr.shape
+    w    = np.isfinite(iarr) & np.isfinite(varr)
+    x    = np.where(w, iarr - io, 0)
+    y    = np.where(w, varr, 0)
+    di   = np.nanmedian(np.abs(np.diff(iarr, axis=1)), axis=1)[:, None]
+    di   = np.where(np.isfinite(di) & (di > 0), di, 1e-300)
+    lo   = np.array([0, -np.inf, 0, -np.inf])   # Ic+ >= 0, Ic- <= 0, Rn >= 0
+    hi   = np.array([np.inf, 0, np.inf, np.inf])
+
+    p    = np.clip(np.broadcast_to(np.asarray(guess, dtype=float),
+                                   (n, 4)).copy(), lo, hi)
+    lam  = np.full(n, 1e-3)
+
+    def _ssr(idx, p):
+        v, jac = _rsj_asym_batch(x[idx], p, di[idx])
+        r = (y[idx] - v)*w[idx]
+        return (r**2).sum(axis=1), r, jac*w[idx][..., None]
+
+    active = np.arange(n)
+    ssr, r, jac = _ssr(active, p)
+    for it in range(maxiter):
+        if not len(active):
+            break
+        idx = active
+        jt  = jac.transpose(0, 2, 1)
+        jtj = jt @ jac
+        g   = (jt @ r[..., None])[..., 0]
+        d   = np.einsum('nii->ni', jtj)
+        a   = jtj + (lam[idx][:, None]*np.maximum(d, 1e-12*d.max(axis=1,
+                     keepdims=True) + 1e-300))[..., None]*np.eye(4)
+        try:
+            dp = np.linalg.solve(a, g[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            dp = (np.linalg.pinv(a) @ g[..., None])[..., 0]
+        # steps across a bound go halfway to it: an Ic stuck at exactly 0
+        # has no gradient
+        pnew = p[idx] + dp
+        pnew = np.where(pnew < lo, (p[idx] + lo)/2, pnew)
+        pnew = np.where(pnew > hi, (p[idx] + hi)/2, pnew)
+        ssr_new, r_new, jac_new = _ssr(idx, pnew)
+
+        # accept improved steps, adapt damping per curve
+        good = ssr_new <= ssr[idx]
+        step = np.abs(pnew - p[idx])
+        p[idx[good]]    = pnew[good]
+        lam[idx[good]] /= 10
+        lam[idx[~good]] *= 10
+        conv = (good & ((ssr[idx] - ssr_new <= ftol*ssr[idx]) |
+                        np.all(step <= xtol*(np.abs(p[idx]) + xtol), axis=1)))\
+            | (lam[idx] > 1e16) | ~np.isfinite(ssr_new)
+        ssr[idx[good]] = ssr_new[good]
+        r[good], jac[good] = r_new[good], jac_new[good]
+        active, r, jac = idx[~conv], r[~conv], jac[~conv]
+
+    # covariance like curve_fit: inv(J^T J) * SSR / dof
+    ssr, r, jac = _ssr(np.arange(n), p)
+    jtj  = jac.transpose(0, 2, 1) @ jac
+    dof  = np.maximum(w.sum(axis=1) - 4, 1)
+    pcov = np.linalg.pinv(jtj)*(ssr/dof)[:, None, None]
+    bad  = ~(np.isfinite(p).all(axis=1) & np.isfinite(ssr))
+    p[bad], pcov[bad] = 0, 0
+    return p, pcov
+
+def fit2rsj_arr(iarr, varr, **kwargs):
+    """Fit IV array to 2 Ic RSJ model and return arrays of fit params, error.
+
+    Keyword arguments:
+    guess: array of (Ic+, Ic-, Rn, Vo)
+    io: fixed Io.
+    updateguess: guess update ratio 0 to 1
+    jobs: number of processes. Default 1 (serial). None: CPU count.
+    chunks: number of contiguous chunks fitted in parallel, each with its
+        own warm-start chain. Chains are seeded by a coarse first pass: a
+        warm-start chain over the first IV of each chunk (quick guess
+        where that fails). Default: jobs.
+    method: "chain" (default): curve_fit per IV as above. "batched": all
+        IVs at once with fit2rsj_batched (model rsj_asym only), seeded by
+        quickguess_rsj_arr unless guess is given: the same quick guess the
+        chain starts from (jjiv2.quickguess_rsj), for every IV.
+    """
+    if 'guess' in kwargs:
+        kwargs['guess'] = np.array(kwargs['guess']) # array type
+    if kwargs.pop('method', 'chain') == 'batched':
+        if kwargs.get('model', 'rsj_asym') != 'rsj_asym':
+            raise ValueError('method "batched" supports model rsj_asym only.')
+        guess = kwargs.get('guess')
+        if guess is None:                       # per-IV quick guesses
+            guess = quickguess_rsj_arr(iarr, varr)
+        return fit2rsj_batched(iarr, varr, guess, kwargs.get('io', 0))
+    jobs = kwargs.pop('jobs', 1)
+    jobs = os.cpu_count() if jobs is None else jobs
+    nchunk = min(kwargs.pop('chunks', jobs), len(iarr))
+    if jobs <= 1 or nchunk <= 1:
+        return _fit2rsj_chain(iarr, varr, kwargs)
+
+    bounds = np.linspace(0, len(iarr), nchunk + 1).astype(int)
+    seeds, _ = _fit2rsj_chain(np.asarray(iarr)[bounds[:-1]],
+                              np.asarray(varr)[bounds[:-1]], kwargs)
+    quick = quickguess_rsj_arr(np.asarray(iarr)[bounds[:-1]],
+                               np.asarray(varr)[bounds[:-1]])
+    chunk_kwargs = []
+    for seed, qseed in zip(seeds, quick):
+        chunk_kwargs.append(dict(kwargs))
+        if seed.any():                          # coarse fit succeeded
+            chunk_kwargs[-1]['guess'] = seed
+        elif np.isfinite(qseed).all() and 'guess' not in kwargs:
+            chunk_kwargs[-1]['guess'] = qseed
+    with ProcessPoolExecutor(max_workers=jobs) as ex:
+        futures = [ex.submit(_fit2rsj_chain, np.asarray(iarr[a:b]),
+                             np.asarray(varr[a:b]), kw)
+                   for a, b, kw in zip(bounds[:-1], bounds[1:],
+                                       chunk_kwargs)]
+        results = [future.result() for future in futures]
+    return (np.concatenate([popt for popt, pcov in results]),
+            np.concatenate([pcov for popt, pcov in results]))
@@ -8,10 +8,15 @@ import numpy as np
 from scipy.optimize import curve_fit, root
 from scipy.special import sici
 from scipy.integrate import quad
+from ..common.modelcache import ModelCache
 
 e = 1.60217657e-19
 hbar = 1.05457173e-34
 kb = 1.3806488e-23
+
+# memoizes the Vc_SFS_B82* models below for repeated fits and scans;
+# set model_cache.cachedir to keep results on disk. See common.modelcache.
+model_cache = ModelCache()
 eps = 1e-16j
 
 def vc_SFS_sinc(d, prefac, xi, d0, phi0):
@@ -78,6 +83,7 @@ def _IsRn_SFS_B82(phi, d, xi, delta, t, **kwargs):
 # Vectorized caller of _IsRn_SFS_B82
 IsRn_SFS_B82 = np.vectorize(_IsRn_SFS_B82)
 
+@model_cache.memoize
 def Vc_SFS_B82(d, xi, delta, t, **kwargs):
     """Clean limit IcRn(d) in Buzdin-1982. Find max IsRn by brute-force
     discretization. Fast.
@@ -94,6 +100,7 @@ def Vc_SFS_B82(d, xi, delta, t, **kwargs):
 
     return np.vectorize(f)(d)
 
+@model_cache.memoize
 def Vc_SFS_B82_slow(d, xi, delta, t, guess, **kwargs):
     """Clean limit IcRn(d) in Buzdin-1982. Find max IsRn with
     scipy.optimize.root(). Slow.
@@ -138,6 +145,85 @@ def Vc_SFS_B82_slow(d, xi, delta, t, guess, **kwargs):
 # Vectorized caller of _Vc_SFS_B82
 #Vc_SFS_B82 = np.vectorize(_Vc_SFS_B82)
 
+# Batched Buzdin-1982 evaluator.
+# The kernel g(z) = sin(z/2)*tanh(delta*cos(z/2)/2t) of _IsRn_SFS_B82 is
+# 2pi-periodic and odd, so g(z) = sum b_n sin(nz) with b_n from one FFT, and
+#   IsRn(phi, d) = pi*delta/2 * sum_n b_n F(n d/xi) sin(n phi),
+#   F(s) = cos(s) - s sin(s) + s^2 Ci(s)     (= 2 s^2 int_s^inf cos(x)/x^3)
+# in closed form (cf. vc_SFS_B82_nearTc: the n = 1 term). A (d x phi) grid
+# is then one matrix product instead of a quad call per element.
+def _B82_coeffs(delta, t, nmax=None):
+    """Return harmonics n and sine coefficients b_n of the B82 kernel.
+
+    nmax: number of harmonics. Default: from delta/t, enough that b_n has
+    decayed below machine precision (the kernel sharpens as t -> 0).
+    """
+    c = np.inf if t == 0 else e*delta/(2*kb*t)   # t < 0 flips the sign
+    if nmax is None:
+        nmax = int(np.clip(2**np.ceil(np.log2(16*min(abs(c), 1e6) + 64)),
+                           64, 2**16))
+    m = 2*nmax
+    z = 2*np.pi*np.arange(m)/m
+    cz = np.cos(z/2)
+    g = np.sin(z/2)*(np.sign(cz) if np.isinf(c) else np.tanh(c*cz))
+    b = -2/m*np.fft.rfft(g).imag[1:nmax+1]
+    return np.arange(1, nmax+1), b
+
+def _B82_weights(d, xi, delta, t, nmax=None):
+    """Return harmonics n and weights w (len(d), nmax) of sin(n phi)."""
+    n, b = _B82_coeffs(delta, t, nmax)
+    s = np.atleast_1d(np.asarray(d, dtype=float))[:, None]/xi*n
+    si, ci = sici(np.where(s == 0, 1, s))
+    F = np.where(s == 0, 1, np.cos(s) - s*np.sin(s) + s**2*ci)
+    return n, np.pi*delta/2*b*F
+
+def IsRn_SFS_B82_grid(phi, d, xi, delta, t, nmax=None):
+    """Clean limit IsRn(phi) in Buzdin-1982 on a (d x phi) grid.
+
+    Same as IsRn_SFS_B82 (without quad) for all pairs of d and phi.
+    Return: array (len(d), len(phi)).
+    """
+    n, w = _B82_weights(d, xi, delta, t, nmax)
+    return w @ np.sin(np.outer(n, np.atleast_1d(phi)))
+
+@model_cache.memoize
+def Vc_SFS_B82_fast(d, xi, delta, t, nphi=64, niter=40, nmax=None):
+    """Clean limit IcRn(d) in Buzdin-1982, batched. See Vc_SFS_B82.
+
+    max |IsRn| over 0 <= phi <= pi is bracketed on a grid of nphi phases,
+    then refined by golden-section steps on all d at once.
+    Return: Vc, phi_max (arrays like d).
+    """
+    n, w = _B82_weights(d, xi, delta, t, nmax)
+    fabs = lambda phi: np.abs(np.sum(w*np.sin(phi[:, None]*n), axis=1))
+
+    phi = np.linspace(0, np.pi, nphi)
+    k = np.argmax(np.abs(w @ np.sin(np.outer(n, phi))), axis=1)
+    lo = phi[np.maximum(k - 1, 0)]
+    hi = phi[np.minimum(k + 1, nphi - 1)]
+    r = (np.sqrt(5) - 1)/2
+    p1, p2 = hi - r*(hi - lo), lo + r*(hi - lo)
+    f1, f2 = fabs(p1), fabs(p2)
+    for m in range(niter):
+        left = f1 > f2                          # max in [lo, p2]
+        hi = np.where(left, p2, hi)
+        lo = np.where(left, lo, p1)
+        p1, p2 = np.where(left, hi - r*(hi - lo), p2), \
+                 np.where(left, p1, lo + r*(hi - lo))
+        pnew = np.where(left, p1, p2)
+        fnew = fabs(pnew)
+        f1, f2 = np.where(left, fnew, f2), np.where(left, f1, fnew)
+    phi_max = (lo + hi)/2
+    Vc = fabs(phi_max)
+    shape = np.shape(d)
+    return Vc.reshape(shape), phi_max.reshape(shape)
+
+def vc_SFS_B82(d, xi, delta, t):
+    """Return clean limit Vc(d) in Buzdin-1982; curve_fit model for xi,
+    delta and t. See Vc_SFS_B82_fast.
+    """
+    return Vc_SFS_B82_fast(d, xi, delta, t)[0]
+
 def vc_vs_d_SFS_clean(d, xi_f, doff, prefac):
     """clean limit vc-d by Buzdin (1982)
     Transparent interface. Deprecated
@@ -249,29 +249,24 @@ class IVArrayBin8b:
         #print self.pts, self.xincr, self.ymult, self.yoff
         f.close()
 
+    def _record_dtype(self, cdim=1):
+        """Return record dtype: cdim*(float) + v, i (byte arrays)"""
+        return np.dtype([('c', 'f4', (cdim,)), ('v', 'i1', (self.pts,)),
+                         ('i', 'i1', (self.pts,))])
+
     # reads datafile with variable number of control params (scalar)
     def readdatafile(self, cdim=1, ltrim=0, rtrim=0):
-        f = open(self.fndat, 'rb')
-        raw = f.read()
-        f.close()
-        dn = 4*cdim + 2*self.pts  # byte count: cdim*(float) + 2*(byte array)
-        n = int(len(raw)/dn) - ltrim - rtrim
-        #self.c = [np.zeros(n)]*cdim
-        self.c = np.zeros((n, cdim))
-        self.v = np.zeros((n, self.pts))
-        self.i = np.zeros((n, self.pts))
-        pp = 0
-        for m in range(ltrim, n-rtrim, 1):
-            # control params
-            for k in range(cdim):
-                self.c[m][k] = struct.unpack('f', raw[pp:(pp+4)])[0]; pp+=4
-
-            # IV      
-            self.v[m] = struct.unpack('%db'%self.pts, raw[pp:(pp+self.pts)]); pp+=self.pts
-            self.i[m] = struct.unpack('%db'%self.pts, raw[pp:(pp+self.pts)]); pp+=self.pts
-        self.v = (self.v-self.yoff[0])*self.ymult[0]
-        self.i = (self.i-self.yoff[1])*self.ymult[1]
-       
+        """Decode all records at once. ltrim/rtrim: records to drop at the
+        start/end."""
+        dt = self._record_dtype(cdim)
+        with open(self.fndat, 'rb') as f:
+            raw = f.read()
+        rec = np.frombuffer(raw, dtype=dt, count=len(raw)//dt.itemsize)
+        rec = rec[ltrim:len(rec)-rtrim]
+        self.c = rec['c'].astype(float)
+        self.v = (rec['v'] - self.yoff[0])*self.ymult[0]
+        self.i = (rec['i'] - self.yoff[1])*self.ymult[1]
+
     def convert2iv(self):
         """convert IV based on custom measurement setup
         """
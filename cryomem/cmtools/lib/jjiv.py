@@ -8,8 +8,10 @@ BB, 2014
 import numpy as np
 from scipy.optimize import curve_fit
 from scipy.integrate import quad, dblquad
+from scipy.interpolate import RectBivariateSpline
 from time import time
-from multiprocessing import Pool
+import hashlib, os
+from . import modelpool
 
 # RSJ function for fit. i: array.
 def vrsj(i, ic, rn, io, vo):
@@ -34,7 +36,103 @@ def v_rsj_asym(i, ic_pos, ic_neg, rn, io, vo):
     return v
 
 # AH model
-def v_ah(i, ic, rn, io, vo, t):
+def _log_expint(a, b, h):
+    """Return log of the integral of exp(linear) over a segment of width h.
+
+    a, b: log of the integrand at the ends. Exact for exp(linear), so steep
+    exponentials (large gamma) stay accurate, and never overflows.
+    """
+    d = np.abs(b - a)
+    small = d < 1e-8
+    ds = np.where(small, 1, d)
+    corr = np.where(small, -d/2, np.log(-np.expm1(-ds)) - np.log(ds))
+    return np.log(h) + np.maximum(a, b) + corr
+
+def _logsumexp(a):
+    """Return log(sum(exp(a))) along the last axis."""
+    m = np.max(a, axis=-1, keepdims=True)
+    m = np.where(np.isfinite(m), m, 0)
+    return np.log(np.sum(np.exp(a - m), axis=-1)) + m[..., 0]
+
+def _ah_log_denominator(x, r, ntheta):
+    """Return log(a1 + a2) of v_ah for x = |i - io|/ic > 0 on a theta grid.
+
+    With phi = r/2*(x*theta + cos(theta)) on ntheta points in [0, 2 pi]:
+        a1 = int e^phi * int e^-phi / (e^(pi r x) - 1)
+        a2 = int_0^2pi e^phi(t1) G(t1) dt1,  G(t1) = int_t1^2pi e^-phi(t2) dt2
+    G is a cumulative sum over the grid. Everything is done in logs.
+    """
+    theta = np.linspace(0, 2*np.pi, ntheta)
+    h = theta[1] - theta[0]
+    phi = 0.5*r*(x[:, None]*theta + np.cos(theta))
+    segp = _log_expint(phi[:, :-1], phi[:, 1:], h)
+    segm = _log_expint(-phi[:, :-1], -phi[:, 1:], h)
+    y = np.pi*r*x
+    loga1 = _logsumexp(segp) + _logsumexp(segm) \
+        - (y + np.log(-np.expm1(-y)))           # log(e^y - 1)
+
+    logg = np.full(phi.shape, -1e300)            # log G; G(2 pi) = 0
+    logg[:, :-1] = np.logaddexp.accumulate(segm[:, ::-1], axis=1)[:, ::-1]
+    psi = phi + logg
+    loga2 = _logsumexp(_log_expint(psi[:, :-1], psi[:, 1:], h))
+    return np.logaddexp(loga1, loga2)
+
+def _v_ah_norm(x, r, rtol=1e-4, ntheta=None, chunk=2**21):
+    """Return v/(ic*rn) in the AH model at x = (i - io)/ic and gamma = r.
+
+    See v_ah for the keyword arguments. Odd in x, 0 at x = 0.
+    """
+    x = np.asarray(x, dtype=float)
+    if ntheta is None:
+        n = (512 + 200*np.sqrt(r))*(1e-4/rtol)**0.25
+        ntheta = 2**int(np.ceil(np.log2(n))) + 1
+    ntheta = ntheta//2*2 + 1                    # odd: nested half grid
+
+    f = np.zeros(x.shape)
+    idx = np.flatnonzero(x != 0)
+    step = max(chunk//ntheta, 1)
+    for m in range(0, len(idx), step):
+        sub = idx[m:m+step]
+        ax = np.abs(x.flat[sub])
+        full = np.exp(-_ah_log_denominator(ax, r, ntheta))
+        half = np.exp(-_ah_log_denominator(ax, r, ntheta//2 + 1))
+        f.flat[sub] = np.sign(x.flat[sub])*4*np.pi/r*(4*full - half)/3
+    return f
+
+def _ah_gamma(ic, t):
+    """Return gamma = hbar*ic/(e*k*t)."""
+    e = 1.60217657e-19
+    hbar = 1.05457173e-34
+    k = 1.3806488e-23
+    return hbar*ic/(e*k*t)
+
+def v_ah(i, ic, rn, io, vo, t, rtol=1e-4, ntheta=None, chunk=2**21):
+    """Return voltage in the Ambegaokar-Halperin model (vectorized).
+
+    All bias points are evaluated at once on a fixed theta grid, with the
+    inner integral as a cumulative sum and Richardson extrapolation
+    between the grid and its half. Exponents are handled in logs, so
+    large gamma = hbar*ic/(e*k*t) does not overflow (v_ah_quad gives nan).
+
+    Keyword arguments:
+        rtol: target error relative to ic*rn; sets the grid size from gamma.
+        ntheta: grid size (overrides rtol). Kept fixed for a given gamma and
+            rtol, so the result is smooth in the fit parameters.
+        chunk: max number of grid values computed at once (memory).
+    """
+    i = np.asarray(i, dtype=float)
+    v = np.zeros(len(i))
+    if t>0 and t<100 and ic>=0 and rn>=0:
+        x = (i-io)/ic
+        v[:] = vo + ic*rn*_v_ah_norm(x, _ah_gamma(ic, t), rtol, ntheta,
+                                     chunk)
+    return v
+
+def v_ah_quad(i, ic, rn, io, vo, t):
+    """Return voltage in the AH model by quad/dblquad at each point.
+
+    Slow reference implementation of v_ah. Overflows at large gamma.
+    """
     e = 1.60217657e-19
     hbar = 1.05457173e-34
     k = 1.3806488e-23
@@ -75,30 +173,187 @@ def v_ah(i, ic, rn, io, vo, t):
     
 def v_ah_caller(arg): return v_ah(*arg)
 
-# multiprocessing version of v_ah()
-def v_ah_mp(i, ic, rn, io, vo, t):
-    
-    nproc = 3
-    n = len(i)
-    args = []
-    v = np.zeros(n)
-    print('Ic = %e, Rn = %f, Tn = %f'%(ic, rn, t))
-    print(i, io, vo)
-    for m in range(nproc):
-        args += [(i[m:n:nproc],ic,rn,io,vo,t)]
-    #print (args)
-    
-    # run processes    
-    pool = Pool(processes=nproc)
-    results = pool.map(v_ah_caller, args)
-    pool.close(); pool.join()   # clean up processes
-    #print(results, pl.shape(results))
-    
-    #v = pl.ravel(pl.transpose(pl.vstack(results)))
-    for m in range(nproc):
-        v[m:n:nproc] = results[m]
-    #print (v, pl.shape(v))
-    return v
+# multiprocessing version of v_ah(). Points are split across a persistent
+# worker pool (modelpool.get_pool(), or the given ModelPool).
+def v_ah_mp(i, ic, rn, io, vo, t, pool=None):
+    pool = pool or modelpool.get_pool()
+    return pool.map_points(v_ah, i, ic, rn, io, vo, t)
+
+# AH lookup table
+AH_TABLE_VERSION = 2             # 2: cell-centre checks, tol holds
+
+class AHTable:
+    """Tabulated normalized AH voltage f(x, gamma) = v/(ic*rn).
+
+    x = (i - io)/ic and gamma = hbar*ic/(e*k*t) are the only variables of
+    the AH model, so one table serves all fits. f is tabulated on an
+    adaptive grid of |x| and log(gamma) and interpolated with a bicubic
+    spline. Points outside the table are evaluated directly (_v_ah_norm).
+
+    The table is saved to cachefile (npz) and reused when its version and
+    grid settings match; otherwise it is rebuilt (about 11 min on one core
+    with the defaults).
+    """
+    def __init__(self, xmax=8, gmin=0.1, gmax=3000, tol=1e-4,
+                 cachefile=None, build=True):
+        """
+        Keyword arguments:
+            xmax: Float. Largest |x| in the table.
+            gmin, gmax: Float. Range of gamma in the table.
+            tol: Float. Max interpolation error relative to ic*rn. Grid
+                edge midpoints and cell centres are refined to tol/2 from
+                values computed to tol/50; with the defaults the error
+                measured at random points is below 0.7*tol.
+            cachefile: String. Default: ~/.cache/cryomem/
+                ah_table_v<N>_<hash>.npz, hash of the settings, so tables
+                of different settings are kept side by side. Set False to
+                skip the disk cache.
+            build: Bool. Load or build the table now. Default True.
+        """
+        self.xmax, self.gmin, self.gmax, self.tol = xmax, gmin, gmax, tol
+        if cachefile is None:
+            digest = hashlib.sha1(self._settings().tobytes()).hexdigest()
+            cachefile = os.path.join(os.path.expanduser("~"), ".cache",
+                                     "cryomem", "ah_table_v{}_{}.npz".format(
+                                         AH_TABLE_VERSION, digest[:8]))
+        self.cachefile = cachefile
+        self.x = self.lg = self.f = self._spline = None
+        self.stats = {"table": 0, "direct": 0}
+        if build:
+            if not self.load():
+                self.build()
+                self.save()
+
+    def _settings(self):
+        return np.array([AH_TABLE_VERSION, self.xmax, self.gmin, self.gmax,
+                         self.tol])
+
+    def _eval(self, x, lg):
+        """Return f directly on the grid x (rows) by log gamma (columns).
+
+        Computed well below tol: evaluation noise near tol would keep the
+        refinement going."""
+        f = np.empty((len(x), len(lg)))
+        for k, g in enumerate(np.exp(lg)):
+            f[:, k] = _v_ah_norm(x, g, rtol=self.tol/50)
+        return f
+
+    def build(self, maxiter=12, verbose=False):
+        """Compute the table, refining x and gamma intervals by bisection
+        until the spline predicts the edge midpoints and cell centres
+        within tol/2 (margin for points in between)."""
+        tol = self.tol/2
+        x = np.union1d(np.linspace(0, 2, 17), np.linspace(2, self.xmax, 7))
+        lg = np.linspace(np.log(self.gmin), np.log(self.gmax),
+                         int(np.ceil(2*np.log10(self.gmax/self.gmin))) + 1)
+        f = self._eval(x, lg)
+        for it in range(maxiter):
+            spl = RectBivariateSpline(x, lg, f)
+            xm, lgm = (x[:-1] + x[1:])/2, (lg[:-1] + lg[1:])/2
+            fxm, fgm = self._eval(xm, lg), self._eval(x, lgm)
+            fc = self._eval(xm, lgm)                # cell centres
+            badc = np.abs(fc - spl(xm, lgm)) > tol
+            badx = (np.abs(fxm - spl(xm, lg)).max(axis=1) > tol) \
+                | badc.any(axis=1)
+            badg = (np.abs(fgm - spl(x, lgm)).max(axis=0) > tol) \
+                | badc.any(axis=0)
+            if verbose:
+                print("Iteration {}: {}x{} grid, refine {}x{}.".format(
+                    it, len(x), len(lg), badx.sum(), badg.sum()))
+            if not badx.any() and not badg.any():
+                break
+            # insert the new rows and columns, then the new corners
+            xn, lgn = xm[badx], lgm[badg]
+            f = np.vstack([np.hstack([f, fgm[:, badg]]),
+                           np.hstack([fxm[badx], fc[badx][:, badg]])])
+            x, lg = np.concatenate([x, xn]), np.concatenate([lg, lgn])
+            ix, ig = np.argsort(x), np.argsort(lg)
+            x, lg, f = x[ix], lg[ig], f[ix][:, ig]
+        else:
+            print("AH table not converged to tol = {}.".format(self.tol))
+        self.x, self.lg, self.f = x, lg, f
+        self._spline = RectBivariateSpline(x, lg, f)
+        return self
+
+    def load(self):
+        """Load the table from cachefile. Return True if it was usable."""
+        if not self.cachefile or not os.path.exists(self.cachefile):
+            return False
+        try:
+            with np.load(self.cachefile) as npz:
+                if not np.array_equal(npz["settings"], self._settings()):
+                    return False
+                self.x, self.lg, self.f = npz["x"], npz["lg"], npz["f"]
+        except Exception:                       # corrupt/partial file
+            return False
+        self._spline = RectBivariateSpline(self.x, self.lg, self.f)
+        return True
+
+    def save(self):
+        """Save the table to cachefile."""
+        if not self.cachefile:
+            return
+        dirname = os.path.dirname(self.cachefile)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        tmpname = self.cachefile + ".tmp.npz"
+        np.savez(tmpname, settings=self._settings(), x=self.x, lg=self.lg,
+                 f=self.f)
+        os.replace(tmpname, self.cachefile)
+
+    def __call__(self, x, gamma):
+        """Return f(x, gamma) = v/(ic*rn), interpolated where tabulated."""
+        x = np.asarray(x, dtype=float)
+        ax = np.abs(x)
+        f = np.empty(x.shape)
+        if self.gmin <= gamma <= self.gmax:
+            inside = ax <= self.xmax
+            f[inside] = np.sign(x[inside])*self._spline.ev(
+                ax[inside], np.full(inside.sum(), np.log(gamma)))
+        else:
+            inside = np.zeros(x.shape, dtype=bool)
+        f[~inside] = _v_ah_norm(x[~inside], gamma, rtol=self.tol)
+        self.stats["table"] += int(inside.sum())
+        self.stats["direct"] += int((~inside).sum())
+        return f
+
+    def v_ah(self, i, ic, rn, io, vo, t):
+        """Return voltage in the AH model from the table. See v_ah."""
+        i = np.asarray(i, dtype=float)
+        v = np.zeros(len(i))
+        if t>0 and t<100 and ic>=0 and rn>=0:
+            v[:] = vo + ic*rn*self((i-io)/ic, _ah_gamma(ic, t))
+        return v
+
+_ah_table = None
+
+def get_ah_table(**kwargs):
+    """Return the shared AHTable, loading or building it on first use.
+
+    Keyword arguments are passed to AHTable and replace the shared table.
+    """
+    global _ah_table
+    if _ah_table is None or kwargs:
+        _ah_table = AHTable(**kwargs)
+    return _ah_table
+
+def _ah_func(table, pool=None):
+    """Return the AH voltage function to fit with.
+
+    table: None/False: direct evaluation, True: the shared AHTable, or an
+        AHTable. A table takes precedence over pool.
+    pool: None/False: v_ah in this process, True: the shared
+        modelpool.ModelPool, or a ModelPool. Direct evaluation is then
+        split across its workers (v_ah_mp).
+    """
+    if table is True:
+        return get_ah_table().v_ah
+    if table is not None and table is not False:
+        return table.v_ah
+    if pool is None or pool is False:
+        return v_ah
+    pool = modelpool.get_pool() if pool is True else pool
+    return lambda i, ic, rn, io, vo, t: v_ah_mp(i, ic, rn, io, vo, t, pool)
 
 class JJIV:
     def __init__(self, i, v):
@@ -159,24 +414,28 @@ class JJIV:
               (np.inf, np.inf, np.inf, np.inf)
 
     # full fit with AH theory. give good initial guess=[Ic, Rn, Io, Vo, T]
-    def fit2ah_full(self, guess = [10, 1, 0, 0, 10]):
-        popt, pcov = curve_fit(v_ah_mp, self.i, self.v, guess)
+    # table: use an AHTable (True: the shared one) instead of v_ah.
+    # pool: evaluate v_ah on a ModelPool (True: the shared one). See _ah_func.
+    def fit2ah_full(self, guess = [10, 1, 0, 0, 10], table=None, pool=None):
+        popt, pcov = curve_fit(_ah_func(table, pool), self.i, self.v, guess)
         self.ic, self.rn, self.io, self.vo, self.tn = popt
         self.ic_err, self.rn_err, self.io_err, self.vo_err, self.tn_err =\
           np.sqrt(np.diag(pcov))       # std deviations of param estimates
 
     # quick fit for Ic, Rn, T only.
-    def fit2ah_ic_rn_tn(self, guess):
-        fitfunc = lambda i, ic, rn, t: v_ah_mp(i, ic, rn, guess[2], guess[3], t)
+    def fit2ah_ic_rn_tn(self, guess, table=None, pool=None):
+        vfunc = _ah_func(table, pool)
+        fitfunc = lambda i, ic, rn, t: vfunc(i, ic, rn, guess[2], guess[3], t)
         guess2 = np.array([guess[0], guess[1], guess[4]])
         popt, pcov = curve_fit(fitfunc, self.i, self.v, guess2, maxfev=0)
         self.ic, self.rn, self.tn = popt
         self.ic_err, self.rn_err, self.tn_err = np.sqrt(np.diag(pcov)) # stdev
 
     # quicker fit for Ic, Rn only.
-    def fit2ah_ic_rn(self, guess):
+    def fit2ah_ic_rn(self, guess, table=None, pool=None):
+        vfunc = _ah_func(table, pool)
         def fitfunc_ic_rn(i, ic, rn):
-            return v_ah_mp(i, ic, rn, guess[2], guess[3], guess[4])
+            return vfunc(i, ic, rn, guess[2], guess[3], guess[4])
             
         #fitfunc_ic_rn = lambda i, ic, rn: v_ah_mp(i, ic, rn, guess[2], guess[3], guess[4])
         guess2 = np.array([guess[0], guess[1]])
@@ -186,8 +445,9 @@ class JJIV:
         self.ic_err, self.rn_err = np.sqrt(np.diag(pcov)) # stdev
 
     # quicker fit for Ic only.
-    def fit2ah_ic(self, guess):
-        fitfunc = lambda i, ic: v_ah_mp(i, ic, guess[1], guess[2], guess[3], guess[4])
+    def fit2ah_ic(self, guess, table=None, pool=None):
+        vfunc = _ah_func(table, pool)
+        fitfunc = lambda i, ic: vfunc(i, ic, guess[1], guess[2], guess[3], guess[4])
         newguess = np.array([guess[0]])
         popt, pcov = curve_fit(fitfunc, self.i, self.v, newguess)
         self.ic = popt
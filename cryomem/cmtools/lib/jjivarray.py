@@ -72,7 +72,11 @@ class JJIVArray(JJIV):
     # fit to Ambegaokar model. Take guess matrix (e.g. from RSJ fit results).
     # guess_arr = [ic_arr, rn_arr, io_arr, vo_arr, tn_arr]
     # f: external function used to deal with intermediate results
-    def fit2ah_ic_rn_tn_array(self, guess_arr, f_report):
+    # table: AHTable for all curves (True: the shared one). See jjiv.AHTable.
+    # pool: ModelPool kept for all curves (True: the shared one); used when
+    #   no table is given. See jjiv._ah_func.
+    def fit2ah_ic_rn_tn_array(self, guess_arr, f_report, table=None,
+                              pool=None):
         #ic0arr, rn0arr, ioarr, voarr, tn0arr = [guess_arr[n] for n in range(5)]
         #print rsj[1:2]; exit(1)
         prev = [0,0,guess_arr[0,4]]
@@ -80,7 +84,7 @@ class JJIVArray(JJIV):
             #sys.stdout.write('%8.4f '%data.i1[n])
             self.set_iv(self.iarr[n], self.varr[n])
             try:
-                self.fit2ah_ic_rn_tn(guess_arr[n])
+                self.fit2ah_ic_rn_tn(guess_arr[n], table, pool)
                 self.icarr[n], self.rnarr[n], self.tnarr[n]\
                   = self.ic, self.rn, self.tn
                 self.ic_err_arr[n], self.rn_err_arr[n], self.tn_err_arr[n] =\
@@ -96,13 +100,14 @@ class JJIVArray(JJIV):
 #              self.vo_err_arr, self.tn_arr][:][:(n+1)]
             f_report(n)  # send out (intermediate) processed results
 
-    # fit to Ambegaokar model; fixed tn
-    def fit2ah_ic_rn_array(self, guess_arr, func_report):
+    # fit to Ambegaokar model; fixed tn. table, pool: see above.
+    def fit2ah_ic_rn_array(self, guess_arr, func_report, table=None,
+                           pool=None):
         prev = [0,0]
         for n in range(self.ndata2):
             self.set_iv(self.iarr[n], self.varr[n])
             try:
-                self.fit2ah_ic_rn(guess_arr[n])
+                self.fit2ah_ic_rn(guess_arr[n], table, pool)
                 self.icarr[n], self.rnarr[n] = self.ic, self.rn
                 self.ic_err_arr[n], self.rn_err_arr[n] =\
                   [self.ic_err, self.rn_err]
@@ -0,0 +1,159 @@
+"""
+Persistent process pool for evaluating expensive per-point models.
+
+curve_fit calls the model many times per fit, so starting processes on each
+call (Pool per call) costs more than the evaluation. ModelPool starts its
+workers once, on first use, and splits the points of each call into
+contiguous chunks of equal size. Input and output arrays are passed
+through shared memory; only the chunk bounds and model parameters are
+pickled. The shared pool (get_pool) is shut down at interpreter exit.
+
+It pays off only with more than one core and when a call costs well over
+the dispatch overhead (about 1 ms): many points or low T for v_ah. See
+cryomem/test/modelpool/bench_modelpool.py.
+
+Example:
+    pool = get_pool()
+    v = pool.map_points(v_ah, i, ic, rn, io, vo, t)     # == v_ah(i, ...)
+"""
+import numpy as np
+import os, atexit
+from multiprocessing import Pool, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+_attached = {}                  # worker side: shm name: SharedMemory
+
+def _attach(names):
+    """Return shared memory blocks by name, attached once per worker.
+
+    Blocks of older calls (replaced by larger ones) are detached. The
+    parent owns the blocks, so workers do not register them with the
+    resource tracker (which would unlink them when a worker exits).
+    """
+    for name in list(_attached):
+        if name not in names:
+            _attached.pop(name).close()
+    for name in names:
+        if name not in _attached:
+            try:
+                shm = SharedMemory(name=name, track=False)  # Python >= 3.13
+            except TypeError:
+                register = resource_tracker.register
+                resource_tracker.register = lambda *args: None
+                try:
+                    shm = SharedMemory(name=name)
+                finally:
+                    resource_tracker.register = register
+            _attached[name] = shm
+    return [_attached[name] for name in names]
+
+def _run_chunk(task):
+    """Worker: evaluate func on points start:stop of the shared input."""
+    func, xname, yname, n, start, stop, args, kwargs = task
+    xshm, yshm = _attach((xname, yname))
+    x = np.ndarray((n,), dtype=float, buffer=xshm.buf)
+    y = np.ndarray((n,), dtype=float, buffer=yshm.buf)
+    y[start:stop] = func(x[start:stop], *args, **kwargs)
+    del x, y                                    # release the buffers
+    return stop - start
+
+def _free(shm):
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+class ModelPool:
+    """Long-lived worker pool for models f(x, *params) -> array like x.
+
+    The model must be a picklable (module-level) function that returns one
+    value per point of a 1-d x.
+    """
+    def __init__(self, processes=None, minchunk=16):
+        """
+        Keyword arguments:
+            processes: Int. Number of workers. Default: os.cpu_count().
+            minchunk: Int. Min points per chunk; shorter inputs are split
+                into fewer chunks or evaluated in this process.
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.minchunk  = minchunk
+        self._pool     = None
+        self._shm      = {}                     # "x"/"y": SharedMemory
+
+    def _buffer(self, key, n):
+        """Return a shared float array of length n, grown as needed.
+
+        Blocks are replaced only when too small, so workers reattach
+        rarely.
+        """
+        shm = self._shm.get(key)
+        if shm is None or shm.size < 8*n:
+            if shm is not None:
+                _free(shm)
+            shm = SharedMemory(create=True, size=max(8*n, 8))
+            self._shm[key] = shm
+        return shm, np.ndarray((n,), dtype=float, buffer=shm.buf)
+
+    def map_points(self, func, x, *args, **kwargs):
+        """Return func(x, *args, **kwargs) evaluated in parallel chunks."""
+        x = np.ravel(np.asarray(x, dtype=float))
+        n = len(x)
+        nchunk = min(self.processes, n//self.minchunk)
+        if self.processes < 2 or nchunk < 2:
+            return np.asarray(func(x, *args, **kwargs), dtype=float)
+
+        if self._pool is None:
+            self._pool = Pool(processes=self.processes)
+        xshm, xbuf = self._buffer("x", n)
+        yshm, ybuf = self._buffer("y", n)
+        xbuf[:] = x
+        bounds = np.linspace(0, n, nchunk + 1).astype(int)
+        tasks = [(func, xshm.name, yshm.name, n, bounds[k], bounds[k+1],
+                  args, kwargs) for k in range(nchunk)]
+        self._pool.map(_run_chunk, tasks)
+        return ybuf.copy()
+
+    def close(self):
+        """Stop the workers and free the shared memory."""
+        if self._pool is not None:
+            self._pool.close(); self._pool.join()
+            self._pool = None
+        for shm in self._shm.values():
+            _free(shm)
+        self._shm.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+_pool = None
+
+def get_pool(**kwargs):
+    """Return the shared ModelPool, created on first use.
+
+    Keyword arguments are passed to ModelPool and replace the shared pool.
+    """
+    global _pool
+    if _pool is None or kwargs:
+        if _pool is not None:
+            _pool.close()
+        _pool = ModelPool(**kwargs)
+    return _pool
+
+@atexit.register
+def close_pool():
+    """Shut down the shared pool (also done at exit)."""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
@@ -10,10 +10,15 @@ import numpy as np
 from scipy.optimize import curve_fit, root
 from scipy.special import sici
 from scipy.integrate import quad
+from ...common.modelcache import ModelCache
 
 e = 1.60217657e-19
 hbar = 1.05457173e-34
 kb = 1.3806488e-23
+
+# memoizes the Vc_SFS_B82* models below for repeated fits and scans;
+# set model_cache.cachedir to keep results on disk. See common.modelcache.
+model_cache = ModelCache()
     
 def vc_SFS_sinc(d, prefac, xi, d0, phi0):
     """Return simple clean limit characteristic voltage in sinc function
@@ -78,6 +83,7 @@ def _IsRn_SFS_B82(phi, d, xi, delta, t, **kwargs):
 # Vectorized caller of _IsRn_SFS_B82
 IsRn_SFS_B82 = np.vectorize(_IsRn_SFS_B82)
 
+@model_cache.memoize
 def Vc_SFS_B82(d, xi, delta, t, **kwargs):
     """clean limit supercurrent-phase relationship in Buzdin-1982
     kwargs for numpy.quad
@@ -93,6 +99,7 @@ def Vc_SFS_B82(d, xi, delta, t, **kwargs):
     return np.vectorize(f)(d)
 
 
+@model_cache.memoize
 def Vc_SFS_B82_slow(d, xi, delta, t, guess, **kwargs):
     """clean limit supercurrent-phase relationship in Buzdin-1982
     kwargs for numpy.quad
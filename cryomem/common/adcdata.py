@@ -0,0 +1,114 @@
+"""
+Raw ADC-code arrays and their compact ".adc" datafile member format.
+
+Scope traces come as 8- or 16-bit integer codes. Keeping the codes plus
+per-channel scale factors instead of floats makes datafiles much smaller.
+Before deflate, codes are delta-encoded along the first axis and
+byte-shuffled (high and low bytes grouped), which compresses slow traces well.
+
+Member layout: magic, uint32 header length, header (repr of a dict with
+descr, shape, yinc, yor, yref, filter), payload.
+"""
+import numpy as np
+import ast, struct
+
+MAGIC = b"\x93ADC\x01"
+
+class AdcArray:
+    """Integer ADC codes with per-channel scale factors.
+
+    Value = (codes - yref)*yinc + yor. yinc, yor and yref are broadcast along
+    the last axis, one per channel (TDS2000: yinc = ymult, yref = yoff).
+    numpy sees the scaled float values, e.g. np.asarray(adc).
+    """
+    def __init__(self, codes, yinc=1, yor=0, yref=0):
+        self.codes = np.asarray(codes)
+        if self.codes.dtype.kind not in "iu":
+            raise TypeError("ADC codes must be integers.")
+        self.yinc = np.atleast_1d(np.asarray(yinc, dtype=float))
+        self.yor  = np.atleast_1d(np.asarray(yor, dtype=float))
+        self.yref = np.atleast_1d(np.asarray(yref, dtype=float))
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def ndim(self):
+        return self.codes.ndim
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __repr__(self):
+        return "AdcArray({}, yinc={}, yor={}, yref={})".format(
+            self.codes, self.yinc, self.yor, self.yref)
+
+    def scaled(self):
+        """Return the scaled float64 array."""
+        return (self.codes - self.yref)*self.yinc + self.yor
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self.scaled()
+        return arr if dtype is None else arr.astype(dtype)
+
+    def same_scale(self, other):
+        """Return True if other has the same code type and scale factors."""
+        return (isinstance(other, AdcArray)
+                and self.codes.dtype == other.codes.dtype
+                and self.codes.shape[1:] == other.codes.shape[1:]
+                and all(np.array_equal(a, b) for a, b in
+                        zip(self._scale(), other._scale())))
+
+    def _scale(self):
+        return self.yinc, self.yor, self.yref
+
+def concatenate(arrs):
+    """Concatenate AdcArrays of the same scale along the first axis."""
+    for arr in arrs[1:]:
+        if not arrs[0].same_scale(arr):
+            raise ValueError("AdcArrays with different scales.")
+    return AdcArray(np.concatenate([arr.codes for arr in arrs]),
+                    *arrs[0]._scale())
+
+def _shuffle(codes):
+    """Return delta-encoded, byte-shuffled bytes of an integer array."""
+    delta = np.ascontiguousarray(codes).copy()
+    if len(delta) > 1:
+        delta[1:] -= codes[:-1]                 # wraps around like the ADC
+    b = delta.reshape(-1).view(np.uint8).reshape(-1, delta.dtype.itemsize)
+    return b.T.tobytes()
+
+def _unshuffle(buf, dtype, shape):
+    """Inverse of _shuffle."""
+    b = np.frombuffer(buf, dtype=np.uint8).reshape(dtype.itemsize, -1)
+    delta = b.T.copy().view(dtype).reshape(shape)
+    return np.cumsum(delta, axis=0, dtype=dtype) if len(delta) else delta
+
+def write_adc(fo, arr):
+    """Write an AdcArray to a binary file-like in the .adc member format."""
+    header = repr({"descr": arr.codes.dtype.str, "shape": arr.codes.shape,
+                   "yinc": arr.yinc.tolist(), "yor": arr.yor.tolist(),
+                   "yref": arr.yref.tolist(), "filter": "delta-shuffle"})
+    header = header.encode("latin1")
+    fo.write(MAGIC + struct.pack("<I", len(header)) + header)
+    fo.write(_shuffle(arr.codes))
+
+def read_adc_header(fi):
+    """Read and return the header dict of an .adc member."""
+    if fi.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not an ADC member.")
+    n = struct.unpack("<I", fi.read(4))[0]
+    return ast.literal_eval(fi.read(n).decode("latin1"))
+
+def read_adc(fi, raw=False):
+    """Read an .adc member. Return scaled floats, or an AdcArray if raw."""
+    header = read_adc_header(fi)
+    dtype  = np.dtype(header["descr"])
+    codes  = _unshuffle(fi.read(), dtype, header["shape"])
+    arr    = AdcArray(codes, header["yinc"], header["yor"], header["yref"])
+    return arr if raw else arr.scaled()
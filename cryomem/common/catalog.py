@@ -0,0 +1,242 @@
+"""
+Datafile catalog: index datafiles into a local SQLite file and query them
+by metadata instead of filename globbing.
+
+Indexed per file: path, size, mtime, data keys and these fields
+    md.<dotted key>     metadata items (see datafile.scan_file)
+    shape.<key>         array shapes known from the member headers
+    <key>.min/max/span  for small 1-d arrays (e.g. B)
+    name.num/type/wafer/chip/device   tags in the datafile name
+Rescans are incremental: only new or changed (size, mtime) files are read.
+
+Example:
+    cat = Catalog("catalog.sqlite")
+    cat.update("data")
+    cat.query("name.chip = 23", "name.type = BIV", "B.span > 0.3",
+              order="-mtime")
+"""
+from . import datafile
+from .numstr import numstr2num
+import pandas as pd
+import numpy as np
+import os, re, sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+_schema = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, size INTEGER, mtime REAL, keys TEXT);
+CREATE TABLE IF NOT EXISTS fields (
+    path TEXT, key TEXT, value, PRIMARY KEY (path, key));
+CREATE INDEX IF NOT EXISTS fields_key_value ON fields (key, value);
+"""
+_max_stats_len = 100000         # arrays up to this size get min/max/span
+
+def parse_filename(fname):
+    """Return a dict of tags in a datafile name.
+
+    Example: RSJ_009_VItrace-HI_B160617_chip23_A01_4000OeP.zip gives
+        num 9, type VItrace-HI, wafer B160617, chip 23, device A01.
+    """
+    tags = os.path.splitext(os.path.basename(fname))[0].split("_")
+    info = {}
+    for k, tag in enumerate(tags):
+        if tag.isdigit() and "num" not in info:
+            info["num"] = int(tag)
+            if k + 1 < len(tags):
+                info["type"] = tags[k + 1]
+        elif tag.startswith("chip") and "chip" not in info:
+            info["chip"] = numstr2num(tag[4:])
+            if k > 0:
+                info["wafer"] = tags[k - 1]
+            if k + 1 < len(tags):
+                info["device"] = tags[k + 1]
+    return info
+
+def _sqlvalue(val):
+    """Return a value storable in SQLite: number, string or None."""
+    if isinstance(val, (bool, np.bool_)):
+        return int(val)
+    if isinstance(val, (int, float, str, np.integer, np.floating)):
+        return val.item() if isinstance(val, np.generic) else val
+    if val is None:
+        return None
+    return str(val)
+
+def index_file(fname, stats=True):
+    """Return (file record, dict of fields) of a datafile for the catalog."""
+    info = datafile.scan_file(fname)
+    fields = {"name." + key: val
+              for key, val in parse_filename(fname).items()}
+    for key in info:
+        if key.startswith("md.") or (key.startswith("shape.")
+                                     and None not in info[key]):
+            fields[key] = info[key]         # not shapes of large text
+
+    # min/max/span of small 1-d arrays such as the field sweep
+    if stats:
+        small = [key for key in info["keys"]
+                 if len(fields.get("shape." + key, ())) == 1
+                 and 0 < fields["shape." + key][0] <= _max_stats_len]
+        if small:
+            with datafile.open_data(fname) as data:
+                for key in small:
+                    arr = data[key]
+                    if arr.dtype.kind in "biuf":
+                        fields[key + ".min"] = float(np.min(arr))
+                        fields[key + ".max"] = float(np.max(arr))
+                        fields[key + ".span"] = float(np.ptp(arr))
+
+    record = (os.path.abspath(fname), info["size"], info["mtime"],
+              " ".join(info["keys"]))
+    return record, fields
+
+def _parse_condition(cond):
+    """Return (key, SQL operator, value) from a "key op value" string."""
+    m = re.match(r"^\s*(\S+?)\s*(==|!=|<=|>=|=|<|>|\slike\s)\s*(.+?)\s*$",
+                 cond)
+    if m is None:
+        raise ValueError("Condition must be 'key op value': " + cond)
+    key, op, val = m.group(1), m.group(2).strip(), m.group(3)
+    return key, "=" if op == "==" else op.upper(), numstr2num(val)
+
+class Catalog:
+    """Index of datafiles in a SQLite database file."""
+    def __init__(self, dbfile="catalog.sqlite"):
+        self.dbfile = dbfile
+        self.db = sqlite3.connect(dbfile)
+        self.db.executescript(_schema)
+
+    def update(self, *src, **kwargs):
+        """Index new or changed datafiles and drop entries of removed files.
+
+        Arguments:
+            src: directories, glob patterns or filenames. Default: "data".
+        Keyword arguments:
+            workers: Int. Number of threads. Default 8.
+            stats: Bool. Index min/max/span of small 1-d arrays. Default True.
+        Return:
+            dict of counts: indexed, unchanged, removed, failed.
+        """
+        workers = kwargs.get("workers", 8)
+        stats   = kwargs.get("stats", True)
+        fnames = []
+        for s in src or ["data"]:
+            fnames += datafile.find_datafiles(s)
+
+        # pick new or changed files
+        known = {path: (size, mtime) for path, size, mtime in
+                 self.db.execute("SELECT path, size, mtime FROM files")}
+        todo = []
+        for fname in fnames:
+            path = os.path.abspath(fname)
+            stat = os.stat(fname)
+            if known.get(path) != (stat.st_size, stat.st_mtime):
+                todo.append(fname)
+
+        def _index(fname):
+            try:
+                return index_file(fname, stats)
+            except Exception as e:
+                print("Failed to index {}: {}".format(fname, e))
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(_index, todo))
+
+        # write to db (sqlite connection is used from this thread only)
+        with self.db:
+            for res in results:
+                if res is None:
+                    continue
+                record, fields = res
+                self.db.execute("DELETE FROM fields WHERE path = ?",
+                                (record[0],))
+                self.db.execute("INSERT OR REPLACE INTO files VALUES "
+                                "(?, ?, ?, ?)", record)
+                self.db.executemany(
+                    "INSERT INTO fields VALUES (?, ?, ?)",
+                    [(record[0], key, _sqlvalue(fields[key]))
+                     for key in fields])
+
+            removed = [path for path in known if not os.path.exists(path)]
+            for path in removed:
+                self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+                self.db.execute("DELETE FROM fields WHERE path = ?", (path,))
+
+        nfailed = sum(res is None for res in results)
+        return {"indexed": len(todo) - nfailed,
+                "unchanged": len(fnames) - len(todo),
+                "removed": len(removed), "failed": nfailed}
+
+    def query(self, *conditions, **kwargs):
+        """Return datafiles matching all conditions as a DataFrame.
+
+        Arguments:
+            conditions: strings "key op value". op: = != < > <= >= like.
+                key: path, size, mtime or an indexed field.
+                Example: "name.chip = 23", "B.span > 0.3".
+        Keyword arguments:
+            order: key to sort by. Prefix "-" for descending. Default -mtime.
+            limit: Int. Max number of rows.
+            columns: list of extra fields to include as columns.
+        Return:
+            pandas DataFrame with path, size, mtime, keys and the fields
+            used in conditions, order and columns.
+        """
+        order   = kwargs.get("order", "-mtime")
+        limit   = kwargs.get("limit", None)
+        columns = kwargs.get("columns", [])
+        columns = [columns] if isinstance(columns, str) else list(columns)
+        filecols = ("path", "size", "mtime", "keys")
+
+        sql, params = ["SELECT files.path FROM files"], []
+        desc = order.startswith("-")
+        okey = order.lstrip("-")
+        if okey not in filecols:
+            sql.append("LEFT JOIN fields o ON o.path = files.path "
+                       "AND o.key = ?")
+            params.append(okey)
+        where = []
+        for cond in conditions:
+            key, op, val = _parse_condition(cond)
+            if key in filecols:
+                where.append("files.{} {} ?".format(key, op))
+            else:
+                where.append("files.path IN (SELECT path FROM fields "
+                             "WHERE key = ? AND value {} ?)".format(op))
+                params.append(key)
+                columns.append(key)
+            params.append(val)
+        if where:
+            sql.append("WHERE " + " AND ".join(where))
+        sql.append("ORDER BY {} {}".format(
+            "files." + okey if okey in filecols else "o.value",
+            "DESC" if desc else "ASC"))
+        if limit is not None:
+            sql.append("LIMIT {:d}".format(int(limit)))
+        paths = [row[0] for row in self.db.execute(" ".join(sql), params)]
+
+        # gather rows in result order
+        if okey not in filecols:
+            columns.append(okey)
+        rows = []
+        for path in paths:
+            row = dict(zip(filecols, self.db.execute(
+                "SELECT * FROM files WHERE path = ?", (path,)).fetchone()))
+            for key in dict.fromkeys(columns):
+                res = self.db.execute("SELECT value FROM fields WHERE "
+                                      "path = ? AND key = ?",
+                                      (path, key)).fetchone()
+                row[key] = None if res is None else res[0]
+            rows.append(row)
+        return pd.DataFrame(rows, columns=list(filecols) +
+                            list(dict.fromkeys(columns)))
+
+    def fields(self, pattern="%"):
+        """Return the list of indexed field keys matching a LIKE pattern."""
+        return [row[0] for row in self.db.execute(
+            "SELECT DISTINCT key FROM fields WHERE key LIKE ? ORDER BY key",
+            (pattern,))]
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,161 @@
+"""
+Cache of parsed datafiles for repeated loads (see datafile.load_data).
+
+Entries are keyed by (path, size, mtime), so a changed file is reloaded
+automatically. A bounded in-memory LRU is backed by an optional on-disk
+cache of uncompressed .npz sidecar files with a total size cap.
+"""
+from . import metadata
+import numpy as np
+import os, copy, hashlib, threading
+from glob import glob
+from io import StringIO
+from collections import OrderedDict
+
+_md_key = "__md__"
+
+def _stamp(fname):
+    """Return cache key of a file: (absolute path, size, mtime in ns)."""
+    st = os.stat(fname)
+    return os.path.abspath(fname), st.st_size, st.st_mtime_ns
+
+def _nbytes(data):
+    return sum(getattr(data[key], "nbytes", 0) for key in data)
+
+class DataCache:
+    """LRU cache of (data, md) tuples.
+
+    Returned data dicts are shallow copies with read-only arrays, and md is
+    a copy, so callers can add keys without corrupting the cache.
+    """
+    def __init__(self, maxitems=32, maxbytes=2**30, cachedir=None,
+                 maxdisk=2**33):
+        """
+        Keyword arguments:
+            maxitems, maxbytes: Int. Limits of the in-memory LRU.
+            cachedir: String. Directory of the on-disk cache. Default: none.
+            maxdisk: Int. Total size cap of the on-disk cache in bytes.
+        """
+        self.maxitems = maxitems
+        self.maxbytes = maxbytes
+        self.cachedir = cachedir
+        self.maxdisk  = maxdisk
+        self._mem     = OrderedDict()           # stamp: (data, md)
+        self._lock    = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+        if cachedir is not None and not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+
+    def load(self, fname, loader):
+        """Return (data, md) of fname from cache or by calling loader()."""
+        stamp = _stamp(fname)
+        with self._lock:
+            if stamp in self._mem:
+                self._mem.move_to_end(stamp)
+                self.hits += 1
+                return self._copy(*self._mem[stamp])
+
+        entry = self._load_disk(stamp)
+        if entry is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            data, md = loader()
+            entry = (dict(data), md)
+            self._save_disk(stamp, *entry)
+        for key in entry[0]:
+            if isinstance(entry[0][key], np.ndarray):
+                entry[0][key].flags.writeable = False
+
+        with self._lock:
+            self._mem[stamp] = entry
+            self._evict_mem()
+        return self._copy(*entry)
+
+    def clear(self):
+        """Empty the in-memory and on-disk cache."""
+        with self._lock:
+            self._mem.clear()
+        if self.cachedir is not None:
+            for fname in glob(os.path.join(self.cachedir, "*.npz")):
+                os.remove(fname)
+
+    def stats(self):
+        """Return a dict of hit/miss counts and memory use."""
+        return {"hits": self.hits, "disk_hits": self.disk_hits,
+                "misses": self.misses, "items": len(self._mem),
+                "bytes": sum(_nbytes(d) for d, md in self._mem.values())}
+
+    def _copy(self, data, md):
+        return dict(data), copy.deepcopy(md)
+
+    def _evict_mem(self):
+        nbytes = sum(_nbytes(d) for d, md in self._mem.values())
+        while len(self._mem) > 1 and (len(self._mem) > self.maxitems or
+                                      nbytes > self.maxbytes):
+            stamp, (data, md) = self._mem.popitem(last=False)
+            nbytes -= _nbytes(data)
+
+    def _diskname(self, stamp):
+        """Return sidecar name: <hash of path>_<hash of size, mtime>.npz"""
+        h1 = hashlib.sha1(stamp[0].encode()).hexdigest()[:16]
+        h2 = hashlib.sha1(repr(stamp[1:]).encode()).hexdigest()[:8]
+        return os.path.join(self.cachedir, "{}_{}.npz".format(h1, h2))
+
+    def _load_disk(self, stamp):
+        if self.cachedir is None:
+            return None
+        fname = self._diskname(stamp)
+        if not os.path.exists(fname):
+            return None
+        try:
+            with np.load(fname, allow_pickle=False) as npz:
+                data = {key: npz[key] for key in npz.files if key != _md_key}
+                md = None
+                if _md_key in npz.files:
+                    md = metadata.load_md(StringIO(str(npz[_md_key])))
+        except Exception:                       # corrupt/partial sidecar
+            os.remove(fname)
+            return None
+        os.utime(fname)                         # mark recently used
+        return data, md
+
+    def _save_disk(self, stamp, data, md):
+        if self.cachedir is None:
+            return
+        fname = self._diskname(stamp)
+        # drop sidecars of older versions of the same file
+        for old in glob(fname.rsplit("_", 1)[0] + "_*.npz"):
+            os.remove(old)
+        arrays = {key: np.asarray(data[key]) for key in data}
+        if md is not None:
+            s = StringIO()
+            metadata.save_md(s, md)
+            arrays[_md_key] = np.array(s.getvalue())
+        tmpname = fname + ".tmp.npz"
+        try:
+            np.savez(tmpname, **arrays)
+            os.replace(tmpname, fname)
+        except Exception:                       # e.g. object arrays
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = [(os.path.getmtime(f), os.path.getsize(f), f)
+                 for f in glob(os.path.join(self.cachedir, "*.npz"))]
+        total = sum(size for mtime, size, f in files)
+        for mtime, size, f in sorted(files):    # least recently used first
+            if total <= self.maxdisk:
+                break
+            os.remove(f)
+            total -= size
+
+default_cache = DataCache()
+
+def set_default_cache(**kwargs):
+    """Replace the cache used by load_data(cache=True). See DataCache."""
+    global default_cache
+    default_cache = DataCache(**kwargs)
+    return default_cache
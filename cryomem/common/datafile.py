@@ -2,45 +2,88 @@
 Handle all kinds of datafiles.
 """
 from . import datafile_cmtools
+from . import datafile_h5
+from . import datacache
 from . import metadata
+from .adcdata import AdcArray
+from . import adcdata
 import pandas as pd
 import numpy as np
-import os, zipfile
+import copy, os, re, struct, sys, time, zipfile
 from io import StringIO, BytesIO
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import as_completed
+from glob import glob
 
 ##### start of old cmtools stuff #####
 
-def cdim_from_filename(filename):
-    """Return N of control parameters"""
+def _tdsbin_cdim(filename):
+    """Return N of control parameters or None if not a tdsbin file name."""
     if ('_VItrace-H_' in filename) or ('_VItrace-Hpulse_' in filename)\
       or ('_VIH_' in filename):
-        cdim = 1
+        return 1
     elif ('_VItrace-IH_' in filename) or ('_VItrace-HI_' in filename):
-        cdim = 2
+        return 2
     elif ('_VItrace-HIpulse_' in filename):
-        cdim = 3
-    else:
+        return 3
+    return None
+
+def cdim_from_filename(filename):
+    """Return N of control parameters"""
+    cdim = _tdsbin_cdim(filename)
+    if cdim is None:
         print('Not a valid data file.'); sys.exit(1)
     return cdim
 
+def _open_tdsbin(root):
+    """Return an IVArrayBin8b reader with the scope config loaded."""
+    data = datafile_cmtools.IVArrayBin8b(root)
+    data.readcfgfile()
+    return data
+
+def _tdsbin_controls(c):
+    """Return a dict of named control arrays from a (n, cdim) array."""
+    controls = {"B": c[:,0]}
+    if c.shape[1] > 1:
+        controls["Ioff"] = c[:,1]
+    return controls
+
 def load_tdsbin(fname, ftype='tdsbin'):
     root, ext = os.path.splitext(fname)
     if ftype == 'tdsbin':                          # Raw trace file
         cdim = cdim_from_filename(root)
-        data = datafile_cmtools.IVArrayBin8b(root)
-        data.readcfgfile()
+        data = _open_tdsbin(root)
         data.readdatafile(cdim=cdim)
         data.convert2iv()
 
         # Now make md and data dataframes.
         mdo = load_cmtools_cfg(root)
         mdo["srcfile"] = root + ".dat"
-        datao = {"B": data.c[:,0], "Ioff": data.c[:,1],
-                 "IV": np.vstack(data.i, data.v).transpose()}
+        datao = _tdsbin_controls(data.c)
+        datao["IV"] = np.column_stack((data.i.ravel(), data.v.ravel()))
     #elif ftype == 'icarr':               # RSJ fit file
     #    data = datafile.CMData_H_Ic_Rn(fname)
     return datao, mdo
 
+def iter_tdsbin(fname, chunk=1024, ltrim=0, rtrim=0):
+    """Iterate over an old tdsbin datafile in blocks of records.
+
+    Memory use is bounded by chunk, so files larger than RAM can be
+    processed. I and V are scaled by the .osccfg and setup file factors.
+
+    Arguments:
+        fname: String. Datafile name with or without extension.
+        chunk: Int. Max number of records (traces) per block.
+        ltrim, rtrim: Int. Number of records to skip at the start/end.
+    Yield:
+        controls, I, V: numpy arrays of shape (n, cdim), (n, pts), (n, pts)
+    """
+    root, ext = os.path.splitext(fname)
+    data = _open_tdsbin(root)
+    return data.iter_records(cdim=cdim_from_filename(root), chunk=chunk,
+                             ltrim=ltrim, rtrim=rtrim)
+
 def load_tdsbin_old(fname, ftype='tdsbin'):
     root, ext = os.path.splitext(fname)
     if ftype == 'tdsbin':                          # Raw trace file
@@ -72,9 +115,302 @@ def load_cmtools_cfg(fname):
 
 ##### end of old cmtools stuff #####
 
-def load_data(fname, dftype="zip"):
+# Alignment of stored (uncompressed) .npy members in the zipfile. numpy pads
+# the .npy header to the same boundary so the array payload is aligned too.
+ZIP_ALIGN = 64
+
+def _npy_memmap(zf, zinfo, mmap_mode="r"):
+    """Return a memmap of a stored .npy member or None if not possible."""
+    if zinfo.compress_type != zipfile.ZIP_STORED or zinfo.flag_bits & 0x1:
+        return None
+    with open(zf.filename, "rb") as f:
+        f.seek(zinfo.header_offset)
+        header = f.read(30)                     # zip local file header
+        if header[:4] != b"PK\x03\x04":
+            return None
+        n, m = struct.unpack("<HH", header[26:30])
+        f.seek(zinfo.header_offset + 30 + n + m)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        elif version == (2, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        else:
+            return None
+        offset = f.tell()
+    if dtype.hasobject or np.prod(shape) == 0:
+        return None
+    return np.memmap(zf.filename, dtype=dtype, mode=mmap_mode, offset=offset,
+                     shape=shape, order="F" if fortran else "C")
+
+TEXT_BLOCK = 2**22              # bytes per block of the text parser
+
+def _count_fields(block):
+    """Return the number of whitespace-separated fields in a bytes block."""
+    b = np.frombuffer(block, dtype=np.uint8)
+    if not len(b):
+        return 0
+    text = (b != 32) & (b != 9) & (b != 10) & (b != 13)
+    return int(text[0]) + int(np.count_nonzero(text[1:] & ~text[:-1]))
+
+def _parse_block(block):
+    """Return the values of a text block or None if it does not parse."""
+    try:
+        vals = np.fromstring(block, sep=" ")
+    except ValueError:
+        return None
+    # fromstring stops at the first bad token (older numpy only warns)
+    return vals if len(vals) == _count_fields(block) else None
+
+def _load_text(df, size=0):
+    """Return an array parsed from a whitespace-separated text stream.
+
+    Same result as np.loadtxt (squeezed) without decoding the member into a
+    string first: blocks of whole lines are tokenized by numpy's C parser
+    straight into a float64 array preallocated from the member size
+    (size: bytes, e.g. zinfo.file_size). Blank lines and "#" comments are
+    skipped; blocks with comments are parsed again with them removed.
+    """
+    line = df.readline()
+    while line and not line.split(b"#")[0].split():
+        line = df.readline()
+    ncol = len(line.split(b"#")[0].split())
+    if ncol == 0:
+        return np.empty((0,))
+    out = np.empty(max(size*ncol//len(line) + ncol, ncol))
+    n, rest, done = 0, line, False
+    while not done:
+        block = df.read(TEXT_BLOCK)
+        done = not block
+        block = rest + block                    # parse whole lines only
+        cut = len(block) if done else block.rfind(b"\n") + 1
+        block, rest = block[:cut], block[cut:]
+        vals = _parse_block(block)
+        if vals is None and b"#" in block:
+            vals = _parse_block(re.sub(rb"#[^\n]*", b"", block))
+        if vals is None:
+            raise ValueError("Could not parse text data after value "
+                             "{}.".format(n))
+        if n + len(vals) > len(out):
+            out.resize(max(n + len(vals), len(out)*3//2), refcheck=False)
+        out[n:n + len(vals)] = vals
+        n += len(vals)
+    if n % ncol:
+        raise ValueError("Rows do not have {} columns.".format(ncol))
+    out.resize(n, refcheck=False)
+    return np.squeeze(out.reshape(-1, ncol))
+
+def _load_member(zf, dfname, mmap_mode=None, raw=False):
+    """Return an array parsed from a data member of an open zipfile.
+
+    The flavor is detected by the member extension: ".npy" is binary,
+    ".adc" is raw ADC codes (scaled unless raw; see adcdata), anything else
+    is whitespace-separated text. With mmap_mode, stored (uncompressed)
+    .npy members are memory-mapped instead of read.
+    """
+    ext = os.path.splitext(dfname)[1]
+    if mmap_mode is not None and ext == ".npy":
+        if mmap_mode not in ("r", "c"):
+            raise ValueError("mmap_mode must be 'r' or 'c'.")
+        arr = _npy_memmap(zf, zf.getinfo(dfname), mmap_mode)
+        if arr is not None:
+            return arr
+    with zf.open(dfname) as df:
+        if ext == ".npy":
+            return np.lib.format.read_array(df, allow_pickle=False)
+        elif ext == ".adc":
+            return adcdata.read_adc(df, raw)
+        else:
+            return _load_text(df, zf.getinfo(dfname).file_size)
+
+def _member_key(dfname):
+    """Return the data key of a member name.
+
+    Members are "<key>.<ext>" or, for chunks written by DataWriter or
+    save_data(mode="a"), "<key>/<part>.<ext>".
+    """
+    head, tail = dfname.split("/", 1) if "/" in dfname else ("", dfname)
+    return head if head else os.path.splitext(tail)[0]
+
+def _group_members(namelist):
+    """Return md member names and a dict of data key: list of member names.
+
+    Chunk members follow the plain member of the same key in part order.
+    md members are "md.txt" and, for updates written in append mode,
+    "md/<part>.txt", in the same order.
+    """
+    mdnames = []
+    members = {}
+    for dfname in namelist:
+        key = _member_key(dfname)
+        if key == "md":
+            mdnames.append(dfname)
+        else:
+            members.setdefault(key, []).append(dfname)
+    mdnames.sort(key=lambda name: ("/" in name, name))
+    for key in members:
+        members[key].sort(key=lambda name: ("/" in name, name))
+    return mdnames, members
+
+class ChunkedArray:
+    """Rows of a data key kept in its chunk members, not concatenated.
+
+    Returned for keys with several members (e.g. written by DataWriter)
+    when loading with mmap_mode, so each part stays memory-mapped if it
+    can be. Indexing along the first axis reads only the parts holding the
+    selected rows; np.asarray() concatenates all of them.
+    """
+    def __init__(self, parts):
+        tail = max((part.shape[1:] for part in parts), key=len)
+        self.parts   = [part.reshape((-1,) + tail) for part in parts]
+        self.offsets = np.cumsum([0] + [len(part) for part in self.parts])
+        self.shape   = (int(self.offsets[-1]),) + tail
+        self.dtype   = np.result_type(*self.parts)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return "ChunkedArray(shape={}, dtype={}, {} parts)".format(
+            self.shape, self.dtype, len(self.parts))
+
+    def __getitem__(self, idx):
+        row, rest = (idx[0], idx[1:]) if isinstance(idx, tuple) else (idx, ())
+        if isinstance(row, (int, np.integer)):
+            n = row + len(self) if row < 0 else row
+            if not 0 <= n < len(self):
+                raise IndexError("Row {} out of range.".format(row))
+            k = np.searchsorted(self.offsets, n, side="right") - 1
+            return self.parts[k][(n - self.offsets[k],) + rest]
+        rows = np.arange(len(self))[row]        # slice, int array or mask
+        where = np.searchsorted(self.offsets, rows, side="right") - 1
+        out = np.empty((len(rows),) + self.shape[1:], dtype=self.dtype)
+        for k in np.unique(where):
+            sel = where == k
+            out[sel] = self.parts[k][rows[sel] - self.offsets[k]]
+        return out[(slice(None),) + rest]
+
+    def __array__(self, dtype=None, copy=None):
+        arr = np.concatenate(self.parts)
+        return arr if dtype is None else arr.astype(dtype)
+
+def _load_key(zf, dfnames, mmap_mode=None, raw=False):
+    """Return an array of a data key concatenated over its chunk members.
+
+    With mmap_mode, several members are returned as a ChunkedArray instead
+    (ADC codes with raw excepted).
+    """
+    parts = [_load_member(zf, dfname, mmap_mode, raw) for dfname in dfnames]
+    if len(parts) == 1:
+        return parts[0]
+    if mmap_mode is not None and not any(isinstance(part, AdcArray)
+                                         for part in parts):
+        return ChunkedArray(parts)
+    if raw and all(isinstance(part, AdcArray) for part in parts):
+        try:
+            return adcdata.concatenate(parts)
+        except ValueError:                      # scale changed: use floats
+            pass
+    parts = [np.asarray(part) for part in parts]
+    # text members lose single-row dimensions (np.loadtxt squeezes)
+    tail = max((part.shape[1:] for part in parts), key=len)
+    return np.concatenate([part.reshape((-1,) + tail) for part in parts])
+
+def _load_md_member(zf, mdnames):
+    """Return metadata parsed from the md members of an open zipfile.
+
+    Later members (updates from append mode) update the top-level items of
+    earlier ones. Return None without md members.
+    """
+    md = None
+    for dfname in mdnames:
+        with zf.open(dfname) as df:
+            part = metadata.load_md(StringIO(df.read().decode("utf-8")))
+        if isinstance(md, dict) and isinstance(part, dict):
+            md.update(part)
+        else:
+            md = part
+    return md
+
+def _save_md_member(zf, md):
+    """Write metadata to an open zipfile: "md.txt", or "md/<part>.txt" if
+    the file already has md (append mode). Member names stay unique."""
+    mdnames, members = _group_members(zf.namelist())
+    foname = "md/{:06d}.txt".format(len(mdnames)) if mdnames else "md.txt"
+    s = StringIO()
+    metadata.save_md(s, md)                     # to mem
+    zf.writestr(foname, s.getvalue())           # to zip
+
+def _npy_zinfo(zf, foname, zip64=False):
+    """Return a ZipInfo for a .npy member with the container compression.
+
+    Stored members get an alignment extra field (zipalign style, id 0xD935)
+    that pads the data to ZIP_ALIGN for memory-mapping.
+    """
+    zinfo = zipfile.ZipInfo(foname, date_time=time.localtime(time.time())[:6])
+    zinfo.compress_type = zf.compression
+    if zf.compression == zipfile.ZIP_STORED:
+        start = (zf.start_dir + 30 + len(zinfo.filename.encode())
+                 + 6 + (20 if zip64 else 0))
+        pad = -start % ZIP_ALIGN
+        zinfo.extra = struct.pack("<HHH", 0xD935, 2 + pad, ZIP_ALIGN)\
+            + b"\0"*pad
+    return zinfo
+
+def _save_member(zf, tag, arr, fmt="txt"):
+    """Write an array to an open zipfile as a member of the given flavor.
+
+    fmt: "txt" (%.6e text, default) or "npy" (binary, bit-exact).
+    Stored .npy members are padded to ZIP_ALIGN for memory-mapping.
+    AdcArray is always written as a deflated ".adc" member: its filter is
+    made for deflate and it is never memory-mapped.
+    """
+    if isinstance(arr, AdcArray):
+        zinfo = zipfile.ZipInfo("{}.adc".format(tag),
+                                date_time=time.localtime(time.time())[:6])
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        with zf.open(zinfo, "w",
+                     force_zip64=arr.nbytes*1.05 > zipfile.ZIP64_LIMIT) as fo:
+            adcdata.write_adc(fo, arr)
+    elif fmt == "npy":
+        arr = np.asanyarray(arr)
+        zip64 = arr.nbytes*1.05 > zipfile.ZIP64_LIMIT
+        zinfo = _npy_zinfo(zf, "{}.npy".format(tag), zip64)
+        with zf.open(zinfo, "w", force_zip64=zip64) as fo:
+            np.lib.format.write_array(fo, arr, allow_pickle=False)
+    else:
+        s = BytesIO()            # StringIO does not work for py3
+        foname  = "{}.txt".format(tag)
+        np.savetxt(s, arr, fmt="%.6e", newline='\r\n')  # to mem
+        zf.writestr(foname, s.getvalue().decode())         # to zip
+
+def _get_dftype(fname, dftype=None):
+    """Return datafile type: given dftype or inferred from the extension."""
+    if dftype is not None:
+        return dftype
+    ext = os.path.splitext(fname)[1].lower()
+    return "h5" if ext in (".h5", ".hdf5") else "zip"
+
+def load_data(fname, dftype=None, mmap_mode=None, cache=None, raw=False):
     """Load and return data (and metadata) from a zipped datafile.
 
+    Text (.txt) and binary (.npy) data members are detected per member.
+
+    Keyword arguments:
+        dftype: "zip" or "h5". Default: from the extension (.h5/.hdf5: h5).
+        mmap_mode: None (default), "r" or "c". Memory-map .npy members saved
+            with compress=False instead of reading them into memory. Keys
+            of several chunk members are ChunkedArray views of the parts.
+        cache: None (default), True (datacache.default_cache) or a
+            datacache.DataCache. Reuse parsed data while the file is
+            unchanged. Cached arrays are read-only.
+        raw: Bool. Return ADC-code members as adcdata.AdcArray instead of
+            scaled floats.
+
     Return:
         data: Dictionary.
             Key: data label.
@@ -82,27 +418,557 @@ def load_data(fname, dftype="zip"):
         md: YAML object (CommentedMap) or None. Metadata.
     """
     root, ext = os.path.splitext(fname)
-    if dftype == "zip":
+    dftype = _get_dftype(fname, dftype)
+    if cache and mmap_mode is None and not raw:
+        cache = datacache.default_cache if cache is True else cache
+        path  = fname if dftype == "h5" else root + ".zip"
+        return cache.load(path, lambda: load_data(fname, dftype))
+    if dftype == "h5":
+        return datafile_h5.load_data(fname)
+    elif dftype == "zip":
         data = {}
         md   = None
         with zipfile.ZipFile(root + ".zip") as zf:
-            for dfname in zf.namelist():        # go through archived files
-                #key = os.path.splitext(dfname)[0].split("_")[-1]
-                key = os.path.splitext(dfname)[0]
-                if key == "md":                 # load metadata
-                    #tmpname = "tmp.yaml"
-                    #zf.extract(dfname, tmpname)
-                    #md = metadata.load_md(file=tmpname)
-                    #os.remove(tmpname)
-                    with zf.open(dfname) as df:
-                        md = metadata.load_md(
-                            StringIO(df.read().decode("utf-8")))
-                else:                           # load data
-                    with zf.open(dfname) as df:
-                        data[key] = np.loadtxt(
-                            StringIO(df.read().decode("utf-8")))
+            mdnames, members = _group_members(zf.namelist())
+            md = _load_md_member(zf, mdnames)   # load metadata
+            for key in members:                 # load data
+                data[key] = _load_key(zf, members[key], mmap_mode, raw)
         return data, md
 
+class LazyData(MutableMapping):
+    """Dict-like zipped datafile that reads data members on demand.
+
+    A member is read and parsed the first time its key is accessed and kept
+    afterwards. Metadata are available as .md without reading any data
+    member. Items can be set or deleted like a dict; this only affects the
+    object in memory, not the file.
+
+    Use as a context manager or call close() to release the file.
+    With mmap_mode ("r" or "c"), members saved with compress=False are
+    memory-mapped and keys of several members are ChunkedArray. With raw, ADC-code members are returned as AdcArray.
+    """
+    def __init__(self, fname, mmap_mode=None, raw=False):
+        root, ext = os.path.splitext(fname)
+        self.fname    = root + ".zip"
+        self.mmap_mode = mmap_mode
+        self.raw      = raw
+        self._zf      = zipfile.ZipFile(self.fname)
+        # key: list of member names
+        self._mdnames, self._members = _group_members(self._zf.namelist())
+        self._keys    = list(self._members)
+        self._data    = {}                      # parsed members
+        self._md      = None
+        self._md_read = False
+
+    @property
+    def md(self):
+        """Metadata (read once on first access) or None."""
+        if not self._md_read:
+            self._md = _load_md_member(self._zf, self._mdnames)
+            self._md_read = True
+        return self._md
+
+    def __getitem__(self, key):
+        if key not in self._data:
+            if key not in self._members:
+                raise KeyError(key)
+            self._data[key] = _load_key(self._zf, self._members[key],
+                                        self.mmap_mode, self.raw)
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        if key not in self._keys:
+            self._keys.append(key)
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        self._keys.remove(key)
+        self._data.pop(key, None)
+        self._members.pop(key, None)
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return "<LazyData {} keys={}>".format(self.fname, self._keys)
+
+    def close(self):
+        """Close the underlying zipfile. Already read members stay valid."""
+        self._zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _sweep_rows(shape, tail):
+    """Return the number of rows of a key shape with row shape tail, or
+    None if not known until loaded (large text members).
+
+    Text members of a single row come back squeezed (shape == tail).
+    Raise ValueError if the shape does not fit the tail.
+    """
+    if len(shape) == len(tail) + 1 and tuple(shape[1:]) == tuple(tail):
+        return shape[0]
+    if tuple(shape) == tuple(tail):
+        return 1
+    raise ValueError("Shape {} does not fit rows of {}.".format(shape, tail))
+
+class VirtualData(MutableMapping):
+    """Several datafiles of one sweep presented as a single dataset.
+
+    Data keys are concatenated along the first (sweep) axis, e.g. B and IV
+    of 009_... and 010_... of the same device. Files must have the same
+    data keys and row shapes; this is checked from the file headers (see
+    scan_file). Members are read on demand from each file:
+    read() and iter_chunks() touch only the files they need, and an item
+    is concatenated in memory on first access (no merged file is written).
+    Keys that are scalars in every file are taken from the first file.
+    Row counts unknown from the headers (large text members) are found by
+    reading the member when first needed.
+
+    .md is the metadata of the first file plus "srcfiles". Items can be set
+    or deleted like a dict (in memory only), as with LazyData.
+    """
+    def __init__(self, fnames, dftype=None, mmap_mode=None, raw=False):
+        self.fnames = find_datafiles(fnames)
+        if not self.fnames:
+            raise ValueError("No datafiles: {}".format(fnames))
+        infos = [scan_file(fname) for fname in self.fnames]
+
+        # compatibility: same keys, same row shape per key
+        self._keys = list(infos[0]["keys"])
+        self._rows  = {}                        # key: rows per file
+        self._tails = {}                        # key: row shape
+        for info in infos[1:]:
+            if set(info["keys"]) != set(self._keys):
+                raise ValueError("Data keys differ: {} {} vs {}".format(
+                    info["path"], info["keys"], self._keys))
+        for key in self._keys:
+            shapes = [tuple(info["shape." + key]) for info in infos]
+            if all(shape == () for shape in shapes):
+                continue                        # fixed scalar
+            tail  = max((shape[1:] for shape in shapes), key=len)
+            try:
+                rows = [_sweep_rows(shape, tail) for shape in shapes]
+            except ValueError:
+                raise ValueError("Shapes of {} differ: {}".format(
+                    key, dict(zip(self.fnames, shapes))))
+            self._rows[key]  = rows
+            self._tails[key] = tail
+
+        self._files = [open_data(fname, dftype, mmap_mode, raw)
+                       for fname in self.fnames]
+        self._data  = {}
+        self._md    = None
+
+    @property
+    def md(self):
+        """Metadata of the first file (copy) with "srcfiles" added."""
+        if self._md is None:
+            md = self._files[0].md
+            self._md = {} if md is None else copy.deepcopy(md)
+            self._md["srcfiles"] = list(self.fnames)
+        return self._md
+
+    def _file_rows(self, key):
+        """Return the list of rows of key per file, reading members whose
+        row count is not known yet."""
+        rows = self._rows[key]
+        for k in range(len(rows)):
+            if rows[k] is None:
+                rows[k] = len(self._part(k, key))
+        return rows
+
+    def nrows(self, key):
+        """Return the total number of rows of a key."""
+        return sum(self._file_rows(key))
+
+    def _part(self, k, key):
+        """Return rows of key in file k with the row shape restored."""
+        return np.asarray(self._files[k][key]).reshape(
+            (-1,) + self._tails[key])
+
+    def read(self, key, start=None, stop=None, step=None):
+        """Return rows start:stop:step of a key, reading only the files
+        that hold them."""
+        if key in self._data or key not in self._rows:
+            return self[key][start:stop:step]
+        idx = np.arange(*slice(start, stop, step).indices(self.nrows(key)))
+        offsets = np.cumsum([0] + self._file_rows(key))
+        files = range(len(self._files))
+        parts = []
+        for k in (files if (step or 1) > 0 else reversed(files)):
+            local = idx[(idx >= offsets[k]) & (idx < offsets[k + 1])]
+            if len(local):
+                parts.append(self._part(k, key)[local - offsets[k]])
+        if not parts:
+            return np.empty((0,) + self._tails[key])
+        return np.concatenate(parts)
+
+    def iter_chunks(self, keys=None):
+        """Yield a dict of key: rows for each file in turn.
+
+        Only one file's members are held at a time (besides what was read
+        before), so a long sweep can be processed piece by piece.
+        """
+        keys = list(self._rows) if keys is None else keys
+        for k in range(len(self._files)):
+            yield {key: self._part(k, key) for key in keys}
+
+    def __getitem__(self, key):
+        if key not in self._data:
+            if key not in self._keys:
+                raise KeyError(key)
+            if key in self._rows:
+                self._data[key] = np.concatenate(
+                    [self._part(k, key) for k in range(len(self._files))])
+            else:
+                self._data[key] = self._files[0][key]
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        if key not in self._keys:
+            self._keys.append(key)
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        self._keys.remove(key)
+        self._data.pop(key, None)
+        self._rows.pop(key, None)
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return "<VirtualData {} files keys={}>".format(len(self._files),
+                                                      self._keys)
+
+    def close(self):
+        """Close all underlying files."""
+        for f in self._files:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_data(fname, dftype=None, mmap_mode=None, raw=False):
+    """Open a datafile for lazy, per-key access.
+
+    fname may also be a list of datafiles of one sweep: they are opened
+    together as a VirtualData, concatenated along the sweep axis.
+
+    Keyword arguments:
+        dftype: "zip" or "h5". Default: from the extension (.h5/.hdf5: h5).
+        mmap_mode: None (default), "r" or "c". Memory-map .npy members saved
+            with compress=False instead of reading them into memory. For h5,
+            items are disk-backed nodes that read only the sliced rows.
+        raw: Bool. Return ADC-code members as AdcArray (zip only).
+    Return:
+        LazyData or H5Data: dict-like. Members are parsed on first access by
+            key. Metadata are available as the .md attribute.
+    """
+    if not isinstance(fname, str):
+        return VirtualData(fname, dftype, mmap_mode, raw)
+    if _get_dftype(fname, dftype) == "h5":
+        return datafile_h5.H5Data(fname, mmap_mode)
+    return LazyData(fname, mmap_mode, raw)
+
+def load_md(fname, dftype=None):
+    """Return only the metadata of a datafile. No data member is read."""
+    root, ext = os.path.splitext(fname)
+    if _get_dftype(fname, dftype) == "h5":
+        return datafile_h5.load_md(fname)
+    with zipfile.ZipFile(root + ".zip") as zf:
+        mdnames, members = _group_members(zf.namelist())
+        return _load_md_member(zf, mdnames)
+
+TEXT_SHAPE_BYTES = 2**16        # text members up to this size get row counts
+
+def _member_shape(zf, dfname):
+    """Return the array shape of a data member without parsing the data.
+
+    .npy, .adc: from the header. Text: (rows, columns), not squeezed, with
+    columns from the first data line. Rows are counted only in members up
+    to TEXT_SHAPE_BYTES and are None (unknown until loaded) in larger ones,
+    so no more than that is read of a text member.
+    """
+    with zf.open(dfname) as df:
+        if os.path.splitext(dfname)[1] == ".adc":
+            return tuple(adcdata.read_adc_header(df)["shape"])
+        if os.path.splitext(dfname)[1] == ".npy":
+            version = np.lib.format.read_magic(df)
+            if version == (1, 0):
+                return np.lib.format.read_array_header_1_0(df)[0]
+            return np.lib.format.read_array_header_2_0(df)[0]
+        if zf.getinfo(dfname).file_size > TEXT_SHAPE_BYTES:
+            line = df.readline()
+            while line and not line.split(b"#")[0].split():
+                line = df.readline()
+            return (None, len(line.split(b"#")[0].split()))
+        lines = [line for line in df.read().splitlines()
+                 if line.split(b"#")[0].split()]
+        if not lines:
+            return (0,)
+        return (len(lines), len(lines[0].split(b"#")[0].split()))
+
+def _key_shape(zf, dfnames):
+    """Return the shape of a data key as load_data would give it.
+
+    The row count is None if a text member's rows are unknown (see
+    _member_shape).
+    """
+    parts = [_member_shape(zf, dfname) for dfname in dfnames]
+    rows  = [part[0] if part else 1 for part in parts]
+    shape = (None if None in rows else sum(rows),)\
+        + max((part[1:] for part in parts), key=len)
+    if all(os.path.splitext(dfname)[1] not in (".npy", ".adc")
+           for dfname in dfnames):
+        shape = tuple(n for n in shape if n != 1)   # like np.loadtxt
+    return shape
+
+def _flatten_md(md, prefix="md"):
+    """Return a flat dict of nested metadata with dotted keys."""
+    flat = {}
+    for key in md:
+        name = "{}.{}".format(prefix, key)
+        if isinstance(md[key], dict):
+            flat.update(_flatten_md(md[key], name))
+        else:
+            flat[name] = md[key]
+    return flat
+
+def scan_file(fname, shapes=True):
+    """Return a flat dict summarizing a datafile without loading the data.
+
+    Keys: path, size, mtime, keys (data keys), shape.<key> (tuple) and
+    md.<dotted md key> for each metadata item. Shapes come from member
+    headers; the row count of keys in large text members is None (see
+    _member_shape).
+    """
+    info = {"path": fname, "size": os.path.getsize(fname),
+            "mtime": os.path.getmtime(fname)}
+    if _get_dftype(fname) == "h5":
+        md   = datafile_h5.load_md(fname)
+        shp  = datafile_h5.get_shapes(fname)
+        keys = list(shp)
+        if not shapes:
+            shp = {}
+    else:
+        with zipfile.ZipFile(fname) as zf:
+            mdnames, members = _group_members(zf.namelist())
+            md = _load_md_member(zf, mdnames)
+            keys, shp = list(members), {}
+            for key in members if shapes else []:
+                shp[key] = _key_shape(zf, members[key])
+    info["keys"] = keys
+    for key in shp:
+        info["shape." + key] = shp[key]
+    if isinstance(md, dict):
+        info.update(_flatten_md(md))
+    return info
+
+def find_datafiles(src):
+    """Return datafile names from a directory (*.zip, *.h5), glob or list."""
+    if not isinstance(src, str):
+        return list(src)
+    if os.path.isdir(src):
+        return sorted(glob(os.path.join(src, "*.zip"))
+                      + glob(os.path.join(src, "*.h5")))
+    return sorted(glob(src))
+
+def scan_data(src, workers=16, shapes=True):
+    """Return a table of metadata and array shapes of many datafiles.
+
+    Files are scanned in parallel threads; only metadata, member headers
+    and small text members are read (see scan_file). Files that fail to open are listed with an "error" column.
+
+    Arguments:
+        src: Directory (all *.zip and *.h5 in it), glob pattern or list.
+    Keyword arguments:
+        workers: Int. Number of threads.
+        shapes: Bool. Also get array shapes (default True).
+    Return:
+        pandas DataFrame. One row per file. See scan_file for columns.
+    """
+    fnames = find_datafiles(src)
+
+    def _scan(fname):
+        try:
+            return scan_file(fname, shapes)
+        except Exception as e:
+            return {"path": fname, "error": repr(e)}
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        rows = list(ex.map(_scan, fnames))
+    return pd.DataFrame(rows)
+
+def _load_keys(fname, keys=None, **kwargs):
+    """Return (data, md) of a datafile with only the given keys read."""
+    if keys is None:
+        return load_data(fname, **kwargs)
+    kwargs.pop("cache", None)
+    with open_data(fname, **kwargs) as lazy:
+        data = {key: np.array(lazy[key]) for key in keys}
+        return data, lazy.md
+
+def load_many(paths, keys=None, workers=8, progress=None, **kwargs):
+    """Load many datafiles in parallel threads (decompression and the
+    parsers release the GIL).
+
+    Arguments:
+        paths: Directory (all *.zip and *.h5 in it), glob pattern or list.
+    Keyword arguments:
+        keys: List of data keys to read. Default: all.
+        workers: Int. Number of threads.
+        progress: Function called as progress(ndone, ntotal, fname) after
+            each file.
+        dftype, mmap_mode, cache, raw: See load_data. mmap_mode is ignored
+            with keys (arrays are read).
+    Return:
+        List of (data, md, error) in the order of paths. For a file that
+        failed to load, data and md are None and error is the exception.
+    """
+    fnames = find_datafiles(paths)
+    if keys is not None:
+        keys = [keys] if isinstance(keys, str) else list(keys)
+        kwargs.pop("mmap_mode", None)
+    results = [None]*len(fnames)
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = {ex.submit(_load_keys, fname, keys, **kwargs): k
+                   for k, fname in enumerate(fnames)}
+        for ndone, future in enumerate(as_completed(futures), 1):
+            k = futures[future]
+            try:
+                results[k] = future.result() + (None,)
+            except Exception as e:
+                results[k] = (None, None, e)
+            if progress is not None:
+                progress(ndone, len(fnames), fnames[k])
+    return results
+
+def _count_parts(namelist):
+    """Return a dict of data key: number of members already stored."""
+    mdnames, members = _group_members(namelist)
+    return {key: len(members[key]) for key in members}
+
+class DataWriter:
+    """Streaming writer for zipped datafiles.
+
+    Rows are appended per key during acquisition and buffered in memory up
+    to chunk_bytes per key, then spilled as a chunk member "<key>/<part>.npy"
+    (".adc" for adcdata.AdcArray rows).
+    Nothing already written is rewritten. Metadata are written on close().
+    load_data/open_data read each key as a single concatenated array, or
+    with mmap_mode as a ChunkedArray of the memory-mapped chunks.
+
+    Example:
+        with DataWriter("data/001_BIV.zip", md=config) as dw:
+            for b in brange:
+                dw.write({"B": b, "IV": get_iv()})
+    """
+    def __init__(self, fname, mode="w", md=None, **kwargs):
+        """
+        Arguments:
+            fname: datafile name.
+            mode: "w": overwrite (default), "a": continue an existing file.
+            md: YAML object or dictionary. Metadata. Can be set later by .md.
+        Keyword arguments:
+            chunk_bytes: buffer size per key before spilling. Default 16 MB.
+            compress: bool. Default False (npy chunks). ".adc" chunks are
+                deflated regardless. See save_data.
+        """
+        root, ext = os.path.splitext(fname)
+        self.fname       = root + ".zip"
+        self.md          = md
+        self.chunk_bytes = kwargs.get("chunk_bytes", 2**24)
+        compression = zipfile.ZIP_DEFLATED if kwargs.get("compress", False)\
+            else zipfile.ZIP_STORED
+        self._zf     = zipfile.ZipFile(self.fname, mode, compression)
+        self._nparts = _count_parts(self._zf.namelist())
+        self._buf    = {}                       # key: list of row blocks
+        self._nbytes = {}
+
+    def append(self, key, rows):
+        """Buffer rows (or a single row/scalar) of a data key.
+
+        Stacked like np.vstack (DipProbeBase.append_data): a scalar is one
+        value, a 1-d array is one row (a trace per step), and 2-d or
+        higher arrays are blocks of rows.
+        AdcArray rows are stored as raw codes; a change of scale factors
+        starts a new chunk.
+        """
+        buf = self._buf.get(key)
+        if isinstance(rows, AdcArray):
+            if rows.ndim == 1:
+                rows = AdcArray(rows.codes[None], *rows._scale())
+            if buf and not rows.same_scale(buf[-1]):
+                self.flush(key)
+        else:
+            rows = np.asanyarray(rows)
+            if rows.ndim == 0:
+                rows = rows.reshape(1)
+            elif rows.ndim == 1:
+                rows = rows[None]
+            if buf and isinstance(buf[-1], AdcArray):
+                self.flush(key)
+        self._buf.setdefault(key, []).append(rows)
+        self._nbytes[key] = self._nbytes.get(key, 0) + rows.nbytes
+        if self._nbytes[key] >= self.chunk_bytes:
+            self.flush(key)
+
+    def write(self, data):
+        """Buffer rows of several keys. data: dict of key: rows."""
+        for key in data:
+            self.append(key, data[key])
+
+    def flush(self, key=None):
+        """Spill buffered rows of a key (default: all keys) to the file."""
+        keys = list(self._buf) if key is None else [key]
+        for key in keys:
+            if not self._buf.get(key):
+                continue
+            rows = self._buf[key]
+            if isinstance(rows[0], AdcArray):
+                arr = adcdata.concatenate(rows)
+            else:
+                arr = rows[0] if len(rows) == 1 else np.concatenate(rows)
+            n    = self._nparts.get(key, 0)
+            _save_member(self._zf, "{}/{:06d}".format(key, n), arr,
+                         fmt="npy")
+            self._nparts[key] = n + 1
+            self._buf[key], self._nbytes[key] = [], 0
+
+    def close(self):
+        """Flush all keys, write metadata and close the file."""
+        if self._zf.fp is None:
+            return
+        self.flush()
+        if self.md is not None:
+            _save_md_member(self._zf, self.md)
+        self._zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()                # keep data acquired before any error
+
 def save_data_old(fname, data, **kwargs):
     """Save metadata and data to a file.
 
@@ -143,51 +1009,175 @@ def save_data(fname, data, mode="w", **kwargs):
         data: Dictionary.
             Key: data label.
             Value: (n-dim but usually 1-d or 2-d) numpy array.
-        mode: "w": overwrite (default), "a": append
+        mode: "w": overwrite (default), "a": append. Appended keys that
+            already exist are stored as chunks; load_data concatenates them.
+            md given in append mode is stored as an update member whose
+            top-level items replace the earlier ones on load.
+            For h5, rows are appended to the existing arrays.
     Keyword arguments:
         md: YAML object (CommentedMap, preferred) or dictionary. Metadata.
+        dftype: "zip" or "h5". Default: from the extension (.h5/.hdf5: h5).
+        fmt: "txt" (default): %.6e text members, human readable.
+             "npy": binary members, bit-exact. 1M x 2 floats: save 0.02 s
+             and load 0.01 s stored vs 6.1 s and 0.56 s as deflated txt
+             (0.76 s and 0.12 s deflated npy, only 4% smaller).
+        compress: bool. Deflate members. Default: True for "txt", False
+             for "npy". Stored .npy members are aligned for memory-mapping
+             (see mmap_mode in load_data).
+    adcdata.AdcArray values are stored as raw ADC codes (".adc" members)
+    regardless of fmt, always deflated; load_data scales them back
+    (raw=True keeps codes).
     """
     md     = kwargs.get("md", None)
-    dftype = kwargs.get("dftype", "zip")
+    dftype = _get_dftype(fname, kwargs.get("dftype", None))
+    fmt    = kwargs.get("fmt", "txt")
+    compression = zipfile.ZIP_DEFLATED if kwargs.get("compress", fmt != "npy")\
+        else zipfile.ZIP_STORED
     root, ext = os.path.splitext(fname)
 
-    if dftype == "zip" or ext.lower() == "zip":
+    if dftype == "h5":
+        dfname = datafile_h5.save_data(fname, data, mode, md=md)
+    elif dftype == "zip":
         dfname = root + ".zip"
-        with zipfile.ZipFile(dfname, mode, zipfile.ZIP_DEFLATED) as zf:
-            # save data
+        with zipfile.ZipFile(dfname, mode, compression) as zf:
+            # save data. Existing keys get a new chunk member (append mode).
+            nparts = _count_parts(zf.namelist())
             for tag in data:
-                s = BytesIO()            # StringIO does not work for py3
-                foname  = "{}.txt".format(tag)
-                np.savetxt(s, data[tag], fmt="%.6e", newline='\r\n')  # to mem
-                zf.writestr(foname, s.getvalue().decode())         # to zip
+                if tag in nparts:
+                    _save_member(zf, "{}/{:06d}".format(tag, nparts[tag]),
+                                 data[tag], fmt=fmt)
+                else:
+                    _save_member(zf, tag, data[tag], fmt=fmt)
 
-            # save md
+            # save md. Append mode adds an update member (see load_md).
             if md != None:
-                s = StringIO()
-                foname  = "md.txt"
-                metadata.save_md(s, md)                 # to mem
-                zf.writestr(foname, s.getvalue())         # to zip
+                _save_md_member(zf, md)
     else:
         dfname = None
     return dfname
 
 
-def conv_tdsbin(finame, foname=None):
+def conv_tdsbin(finame, foname=None, fmt="txt", chunk=1024, compress=None):
     """Convert old tdsbin (BIarrVarr) datafile to zipped txt files.
 
+    Records are streamed in blocks (see iter_tdsbin) so memory use does not
+    grow with the file size.
+
     Arguments:
         finame : String
         foname : String. Default: same as finame
+        fmt : String. Member format "txt" (default) or "npy".
+        chunk : Int. Number of records converted at a time.
+        compress : Bool. Deflate members. Default: True for "txt", False
+            for "npy" (memory-mappable), as in save_data.
     """
-    data, md = load_tdsbin(finame)
     if foname == None:
         foname = finame
-    return save_data(foname, data, "w", md=md)
+    root, ext = os.path.splitext(finame)
+    cdim = _tdsbin_cdim(root)
+    if cdim is None:
+        raise ValueError("Not a tdsbin datafile name: {}".format(finame))
+    md = load_cmtools_cfg(root)
+    md["srcfile"] = root + ".dat"
+
+    reader = _open_tdsbin(root)
+    shape = (reader.nrecords(cdim)*reader.pts, 2)
+    dfname = os.path.splitext(foname)[0] + ".zip"
+    compress = fmt != "npy" if compress is None else compress
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    with zipfile.ZipFile(dfname, "w", compression) as zf:
+        # IV member written block by block; controls are small
+        c = []
+        zip64 = shape[0]*shape[1]*8*1.05 > zipfile.ZIP64_LIMIT
+        zinfo = _npy_zinfo(zf, "IV.npy", zip64) if fmt == "npy"\
+            else "IV.txt"
+        with zf.open(zinfo, "w", force_zip64=zip64) as fo:
+            if fmt == "npy":
+                np.lib.format.write_array_header_1_0(fo, {
+                    "descr": np.lib.format.dtype_to_descr(np.dtype(float)),
+                    "fortran_order": False, "shape": shape})
+            for cblock, i, v in reader.iter_records(cdim=cdim, chunk=chunk):
+                iv = np.column_stack((i.ravel(), v.ravel()))
+                if fmt == "npy":
+                    fo.write(iv.tobytes())
+                else:
+                    np.savetxt(fo, iv, fmt="%.6e", newline='\r\n')
+                c.append(cblock)
+        c = np.concatenate(c) if c else np.zeros((0, cdim))
+        controls = _tdsbin_controls(c)
+        for tag in controls:
+            _save_member(zf, tag, controls[tag], fmt=fmt)
+
+        s = StringIO()
+        metadata.save_md(s, md)
+        zf.writestr("md.txt", s.getvalue())
+    return dfname
+
+
+def _is_converted(finame, foname):
+    """Return True if foname is newer than the tdsbin source files."""
+    if not os.path.exists(foname):
+        return False
+    root, ext = os.path.splitext(finame)
+    srcs = [root + ext2 for ext2 in (".dat", ".txt", ".osccfg")]
+    tsrc = max(os.path.getmtime(src) for src in srcs if os.path.exists(src))
+    return os.path.getmtime(foname) >= tsrc
+
+def conv_tdsbin_bulk(src, jobs=None, force=False, fmt="txt"):
+    """Convert many old tdsbin datafiles in parallel.
+
+    Outputs newer than their sources are skipped, so an interrupted
+    migration can simply be rerun.
+
+    Arguments:
+        src : String. Directory (all *.dat in it) or glob pattern. Files
+            whose name is not a tdsbin type (see cdim_from_filename) are
+            ignored.
+    Keyword arguments:
+        jobs : Int. Number of worker processes. Default: CPU count.
+        force : Bool. Convert even if the output is up to date.
+        fmt : String. Member format "txt" (default) or "npy".
+    Return:
+        summary: dict with counts, ignored files, failures, elapsed time
+            and throughput.
+    """
+    pattern = os.path.join(src, "*.dat") if os.path.isdir(src) else src
+    finames = sorted(glob(pattern))
+    ignored = [fi for fi in finames if _tdsbin_cdim(fi) is None]
+    finames = [fi for fi in finames if _tdsbin_cdim(fi) is not None]
+    todo = [fi for fi in finames
+            if force or not _is_converted(fi, os.path.splitext(fi)[0] + ".zip")]
+    nbytes = sum(os.path.getsize(fi) for fi in todo)
+    print("{} datafiles, {} to convert ({:.1f} MB), {} ignored.".format(
+          len(finames), len(todo), nbytes/1e6, len(ignored)))
+
+    failed = {}
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=jobs) as ex:
+        futures = {ex.submit(conv_tdsbin, fi, None, fmt): fi for fi in todo}
+        for k, future in enumerate(as_completed(futures)):
+            fi = futures[future]
+            try:
+                print("[{}/{}] {}".format(k + 1, len(todo), future.result()))
+            except Exception as e:
+                failed[fi] = repr(e)
+                print("[{}/{}] Failed: {}: {}".format(k + 1, len(todo), fi, e))
+    dt = max(time.time() - t0, 1e-9)
+
+    nconv = len(todo) - len(failed)
+    print("Converted {} files in {:.1f} s: {:.2f} files/s, {:.2f} MB/s.".format(
+          nconv, dt, nconv/dt, nbytes/1e6/dt))
+    return {"converted": nconv, "skipped": len(finames) - len(todo),
+            "ignored": ignored, "failed": failed, "seconds": dt,
+            "files_per_s": nconv/dt, "MB_per_s": nbytes/1e6/dt}
 
 
 def deserialize_data(data, controls, targets):
     """Return data deserialized by control keys.
 
+    Copies may be made and complete sweeps are assumed; see
+    sweeparray.from_data for labelled views that handle aborted sweeps.
+
     data: Dictionary of arrays or like.
     control: List of keys for deserializing parameters.
     target: List of keys.
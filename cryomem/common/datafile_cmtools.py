@@ -245,35 +245,62 @@ class IVArrayBin8b:
         #print self.pts, self.xincr, self.ymult, self.yoff
         f.close()
 
+    def _record_dtype(self, cdim=1):
+        """Return record dtype: cdim*(float) + v, i (byte arrays)"""
+        return np.dtype([('c', 'f4', (cdim,)), ('v', 'i1', (self.pts,)),
+                         ('i', 'i1', (self.pts,))])
+
     # reads datafile with variable number of control params (scalar)
     def readdatafile(self, cdim=1, ltrim=0, rtrim=0):
-        f = open(self.fndat, 'rb')
-        raw = f.read()
-        f.close()
-        dn = 4*cdim + 2*self.pts  # byte count: cdim*(float) + 2*(byte array)
-        n = int(len(raw)/dn) - ltrim - rtrim
-        #self.c = [np.zeros(n)]*cdim
-        self.c = np.zeros((n, cdim))
-        self.v = np.zeros((n, self.pts))
-        self.i = np.zeros((n, self.pts))
-        pp = 0
-        for m in range(ltrim, n-rtrim, 1):
-            # control params
-            for k in range(cdim):
-                self.c[m][k] = struct.unpack('f', raw[pp:(pp+4)])[0]; pp+=4
-
-            # IV      
-            self.v[m] = struct.unpack('%db'%self.pts, raw[pp:(pp+self.pts)]); pp+=self.pts
-            self.i[m] = struct.unpack('%db'%self.pts, raw[pp:(pp+self.pts)]); pp+=self.pts
-        self.v = (self.v-self.yoff[0])*self.ymult[0]
-        self.i = (self.i-self.yoff[1])*self.ymult[1]
-       
+        """Decode all records at once. ltrim/rtrim: records to drop at the
+        start/end."""
+        dt = self._record_dtype(cdim)
+        with open(self.fndat, 'rb') as f:
+            raw = f.read()
+        rec = np.frombuffer(raw, dtype=dt, count=len(raw)//dt.itemsize)
+        rec = rec[ltrim:len(rec)-rtrim]
+        self.c = rec['c'].astype(float)
+        self.v = (rec['v'] - self.yoff[0])*self.ymult[0]
+        self.i = (rec['i'] - self.yoff[1])*self.ymult[1]
+
+    def nrecords(self, cdim=1):
+        """Return the number of complete records in the datafile."""
+        return os.path.getsize(self.fndat)//self._record_dtype(cdim).itemsize
+
+    def iter_records(self, cdim=1, chunk=1024, ltrim=0, rtrim=0,
+                     convert=True):
+        """Yield (c, i, v) blocks of up to chunk records from a memmap.
+
+        Memory use is bounded by chunk regardless of the file size.
+        convert: also apply the measurement setup factors (convert2iv).
+        """
+        dt = self._record_dtype(cdim)
+        n = self.nrecords(cdim)
+        if n - ltrim - rtrim <= 0:
+            return
+        rec = np.memmap(self.fndat, dtype=dt, mode='r', shape=(n,))
+        if convert:
+            i_per_v, gain = self.get_iv_factors()
+        else:
+            i_per_v, gain = 1, 1
+        for m in range(ltrim, n - rtrim, chunk):
+            block = rec[m:min(m + chunk, n - rtrim)]
+            c = block['c'].astype(float)
+            v = (block['v'] - self.yoff[0])*(self.ymult[0]/gain)
+            i = (block['i'] - self.yoff[1])*(self.ymult[1]*i_per_v)
+            yield c, i, v
+
+    def get_iv_factors(self):
+        """Return (i per v of sweep bias, v amp gain) from the setup file."""
+        cfg = DAQParamsDipstick(self.fnsetup)
+        return cfg.i_per_v_swpbias, cfg.gain
+
     def convert2iv(self):
         """convert IV based on custom measurement setup
         """
-        cfg = DAQParamsDipstick(self.fnsetup)
-        self.v /= cfg.gain            # apply v amp gain
-        self.i *= cfg.i_per_v_swpbias # apply i/v factor
+        i_per_v, gain = self.get_iv_factors()
+        self.v /= gain                # apply v amp gain
+        self.i *= i_per_v             # apply i/v factor
 
     def get_minmax_wfm(self, data):
         pass
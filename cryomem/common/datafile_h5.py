@@ -0,0 +1,168 @@
+"""
+HDF5 backend for datafiles (dftype "h5"). Requires PyTables.
+
+Each data key is a chunked, compressed array node under the root group,
+extendable along the first (sweep) axis. Metadata are kept as a YAML string
+in the "md" attribute of the root group.
+"""
+from . import metadata
+import numpy as np
+from io import StringIO
+from collections.abc import MutableMapping
+
+FILTERS = {"complevel": 5, "complib": "zlib", "shuffle": True}
+
+def _tables():
+    """Import PyTables on demand; it is only needed for this backend."""
+    import tables
+    return tables
+
+def _read_md(h5f):
+    """Return metadata from an open file or None."""
+    attrs = h5f.root._v_attrs
+    if "md" not in attrs._v_attrnames:
+        return None
+    return metadata.load_md(StringIO(attrs.md))
+
+def load_data(fname):
+    """Load and return data (and metadata) from an HDF5 datafile.
+
+    Return: data (dict of arrays), md (dict or None). See datafile.load_data.
+    """
+    tb = _tables()
+    data = {}
+    with tb.open_file(fname, "r") as h5f:
+        md = _read_md(h5f)
+        for node in h5f.iter_nodes(h5f.root, classname="Leaf"):
+            data[node.name] = node.read()
+    return data, md
+
+def load_md(fname):
+    """Return only the metadata of an HDF5 datafile."""
+    with _tables().open_file(fname, "r") as h5f:
+        return _read_md(h5f)
+
+def get_shapes(fname):
+    """Return a dict of data key: array shape without reading any data."""
+    with _tables().open_file(fname, "r") as h5f:
+        return {node.name: tuple(int(n) for n in node.shape)
+                for node in h5f.iter_nodes(h5f.root, classname="Leaf")}
+
+def _create_rows(h5f, key, arr, filters):
+    """Create an extendable array node of key holding the rows of arr."""
+    tb = _tables()
+    node = h5f.create_earray(
+        h5f.root, key, atom=tb.Atom.from_dtype(arr.dtype),
+        shape=(0,) + arr.shape[1:], filters=filters,
+        expectedrows=max(len(arr), 1000))
+    node.append(arr)
+
+def save_data(fname, data, mode="w", md=None):
+    """Save metadata and data to an HDF5 datafile.
+
+    mode: "w": overwrite (default), "a": append rows to existing keys along
+        the first axis and add new keys. As with zipped datafiles, a scalar
+        appended to an existing key is one more row, and md updates the
+        top-level items of the stored md.
+    Return: datafile name.
+    """
+    tb = _tables()
+    filters = tb.Filters(**FILTERS)
+    with tb.open_file(fname, mode) as h5f:
+        for key in data:
+            arr = np.asanyarray(data[key])
+            if key in h5f.root:                         # append rows
+                node = h5f.get_node(h5f.root, key)
+                if isinstance(node, tb.EArray):
+                    node.append(arr.reshape((-1,) + node.shape[1:]))
+                    continue
+                # fixed array (e.g. a scalar): rewrite it extendable
+                old  = node.read()
+                tail = max(old.shape[1:], arr.shape[1:], key=len)
+                rows = np.concatenate([old.reshape((-1,) + tail),
+                                       arr.reshape((-1,) + tail)])
+                h5f.remove_node(h5f.root, key)
+                _create_rows(h5f, key, rows, filters)
+            elif arr.ndim == 0:                         # fixed scalar
+                h5f.create_array(h5f.root, key, arr)
+            else:
+                _create_rows(h5f, key, arr, filters)
+
+        if md is not None:
+            old = _read_md(h5f) if mode == "a" else None
+            if isinstance(old, dict) and isinstance(md, dict):
+                old.update(md)
+                md = old
+            s = StringIO()
+            metadata.save_md(s, md)
+            h5f.root._v_attrs.md = s.getvalue()
+    return fname
+
+class H5Data(MutableMapping):
+    """Dict-like HDF5 datafile that reads data nodes on demand.
+
+    Same interface as datafile.LazyData. read() returns a slice of a key
+    without reading the rest. With mmap_mode set, items are the disk-backed
+    nodes themselves: indexing them reads only the requested rows.
+    """
+    def __init__(self, fname, mmap_mode=None):
+        self.fname     = fname
+        self.mmap_mode = mmap_mode
+        self._h5f      = _tables().open_file(fname, "r")
+        self._keys     = [node.name for node in
+                          self._h5f.iter_nodes(self._h5f.root, "Leaf")]
+        self._data     = {}
+        self._md       = None
+        self._md_read  = False
+
+    @property
+    def md(self):
+        """Metadata (read once on first access) or None."""
+        if not self._md_read:
+            self._md = _read_md(self._h5f)
+            self._md_read = True
+        return self._md
+
+    def read(self, key, start=None, stop=None, step=None):
+        """Return rows start:stop:step of a key read from disk."""
+        if key in self._data:
+            return self._data[key][start:stop:step]
+        return self._h5f.get_node(self._h5f.root, key)[start:stop:step]
+
+    def __getitem__(self, key):
+        if key not in self._data:
+            if key not in self._keys:
+                raise KeyError(key)
+            node = self._h5f.get_node(self._h5f.root, key)
+            self._data[key] = node if self.mmap_mode else node.read()
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        if key not in self._keys:
+            self._keys.append(key)
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        self._keys.remove(key)
+        self._data.pop(key, None)
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return "<H5Data {} keys={}>".format(self.fname, self._keys)
+
+    def close(self):
+        """Close the file. Nodes returned with mmap_mode become invalid."""
+        self._h5f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,171 @@
+"""
+Memoization of expensive model functions (e.g. sfs.Vc_SFS_B82) for fits.
+
+Optimizers and parameter scans call models repeatedly with the same
+measured x array and nearly identical parameters. Results are keyed by the
+function, parameters rounded to a number of significant digits and a hash
+of array arguments. A bounded in-memory LRU is backed by an optional
+on-disk store of .npz files (see datacache.DataCache for the data side).
+
+Example:
+    model_cache = ModelCache(cachedir="modelcache")
+
+    @model_cache.memoize
+    def vc(d, xi, delta, t): ...
+
+    model_cache.stats()     # hits, disk_hits, misses, hit_rate, items
+"""
+import numpy as np
+import os, functools, hashlib, threading
+from glob import glob
+from collections import OrderedDict
+
+class ModelCache:
+    """LRU cache of model results.
+
+    Results are returned as copies, so callers can modify them. Keys round
+    float parameters to digits significant digits: keep digits well above
+    what the fit resolves (curve_fit steps parameters by ~1e-8 relative to
+    estimate derivatives), or the derivatives come out zero.
+    """
+    def __init__(self, maxitems=1024, cachedir=None, maxdisk=2**28,
+                 digits=12):
+        """
+        Keyword arguments:
+            maxitems: Int. Size of the in-memory LRU.
+            cachedir: String. Directory of the on-disk store. Default: none.
+                Can be set later.
+            maxdisk: Int. Total size cap of the on-disk store in bytes.
+            digits: Int. Significant digits of float parameters in keys.
+        """
+        self.maxitems = maxitems
+        self.cachedir = cachedir
+        self.maxdisk  = maxdisk
+        self.digits   = digits
+        self._mem     = OrderedDict()           # key: result
+        self._lock    = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+
+    def _keypart(self, x):
+        """Return a hashable, repr-stable form of an argument."""
+        if isinstance(x, (float, np.floating)):
+            return float("{:.{}g}".format(x, self.digits))
+        if isinstance(x, (bool, int, str, np.integer, type(None))):
+            return x
+        if isinstance(x, (list, tuple, np.ndarray)):
+            arr = np.ascontiguousarray(x)
+            if arr.dtype.kind in "biuf":
+                return (arr.dtype.str, arr.shape,
+                        hashlib.sha1(arr.tobytes()).hexdigest())
+        return repr(x)
+
+    def key(self, func, args, kwargs):
+        """Return the cache key (hex string) of a call."""
+        parts = ("{}.{}".format(func.__module__, func.__qualname__),
+                 tuple(self._keypart(a) for a in args),
+                 tuple((k, self._keypart(kwargs[k])) for k in sorted(kwargs)))
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def call(self, func, *args, **kwargs):
+        """Return func(*args, **kwargs) from cache or by calling it."""
+        key = self.key(func, args, kwargs)
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return _copy(self._mem[key])
+
+        res = self._load_disk(key)
+        if res is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            res = func(*args, **kwargs)
+            self._save_disk(key, res)
+        with self._lock:
+            self._mem[key] = _copy(res)
+            while len(self._mem) > self.maxitems:
+                self._mem.popitem(last=False)
+        return res
+
+    def memoize(self, func):
+        """Decorator: cache the results of func. The undecorated function
+        is available as the __wrapped__ attribute."""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        wrapper.cache = self
+        return wrapper
+
+    def clear(self, disk=True):
+        """Empty the in-memory (and on-disk) cache and reset the counts."""
+        with self._lock:
+            self._mem.clear()
+            self.hits = self.disk_hits = self.misses = 0
+        if disk and self.cachedir is not None:
+            for fname in glob(os.path.join(self.cachedir, "*.npz")):
+                os.remove(fname)
+
+    def stats(self):
+        """Return a dict of hit/miss counts, hit rate and cache size."""
+        ncalls = self.hits + self.disk_hits + self.misses
+        return {"hits": self.hits, "disk_hits": self.disk_hits,
+                "misses": self.misses, "items": len(self._mem),
+                "hit_rate": (self.hits + self.disk_hits)/ncalls
+                            if ncalls else 0.}
+
+    def _diskname(self, key):
+        return os.path.join(self.cachedir, key + ".npz")
+
+    def _load_disk(self, key):
+        if self.cachedir is None:
+            return None
+        fname = self._diskname(key)
+        if not os.path.exists(fname):
+            return None
+        try:
+            with np.load(fname, allow_pickle=False) as npz:
+                res = [npz["r{}".format(k)] for k in range(int(npz["n"]))]
+                res = tuple(res) if npz["tuple"] else res[0]
+        except Exception:                       # corrupt/partial file
+            os.remove(fname)
+            return None
+        os.utime(fname)                         # mark recently used
+        return res
+
+    def _save_disk(self, key, res):
+        if self.cachedir is None:
+            return
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+        items = res if isinstance(res, tuple) else (res,)
+        arrays = {"r{}".format(k): np.asarray(r) for k, r in enumerate(items)}
+        if any(arr.dtype.hasobject for arr in arrays.values()):
+            return                              # not loadable without pickle
+        fname = self._diskname(key)
+        tmpname = fname + ".tmp.npz"
+        try:
+            np.savez(tmpname, n=len(items), tuple=isinstance(res, tuple),
+                     **arrays)
+            os.replace(tmpname, fname)
+        except Exception:                       # e.g. disk full
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = [(os.path.getmtime(f), os.path.getsize(f), f)
+                 for f in glob(os.path.join(self.cachedir, "*.npz"))]
+        total = sum(size for mtime, size, f in files)
+        for mtime, size, f in sorted(files):    # least recently used first
+            if total <= self.maxdisk:
+                break
+            os.remove(f)
+            total -= size
+
+def _copy(res):
+    """Return a copy of a result: array, scalar or tuple of them."""
+    if isinstance(res, tuple):
+        return tuple(_copy(r) for r in res)
+    return res.copy() if isinstance(res, np.ndarray) else res
@@ -0,0 +1,221 @@
+"""
+Labelled N-D views of flat sweep data.
+
+Datafiles store sweeps flat: e.g. B (nB,) and IV (nB*npts, 2) for an IV
+curve of npts samples at each field. SweepArray presents IV as an array of
+dims ("B", "sample", "col") with B as the coordinate of the first dim,
+without copying the stored data. An aborted sweep (last row short) is
+either copied once, padded with NaN and masked where samples are missing,
+or (partial="drop") viewed without copying up to its last complete row.
+
+Example:
+    iv = SweepArray.from_flat(data["IV"], [("B", data["B"])])
+    iv.sel(B=0.01).values[:, 1]        # V of the IV closest to B = 0.01
+"""
+import numpy as np
+
+class SweepArray:
+    """N-D array with named dims, coordinate arrays and an optional mask."""
+    def __init__(self, values, dims, coords=None, mask=None):
+        """
+        Arguments:
+            values: N-D array.
+            dims: names of the dims, one per axis of values.
+        Keyword arguments:
+            coords: dict of dim: 1-d coordinate array. Dims without one are
+                indexed by position.
+            mask: bool array of values.shape, True at missing samples.
+        """
+        self.values = values
+        self.dims   = tuple(dims)
+        self.coords = dict(coords or {})
+        self.mask   = mask
+        if len(self.dims) != self.values.ndim:
+            raise ValueError("{} dims for a {}-d array.".format(
+                len(self.dims), self.values.ndim))
+        for dim in self.coords:
+            n = self.values.shape[self.dims.index(dim)]
+            if len(self.coords[dim]) != n:
+                raise ValueError("Coordinate {} has {} values, dim has {}."
+                                 .format(dim, len(self.coords[dim]), n))
+
+    @classmethod
+    def from_flat(cls, flat, controls, npts=None, sample="sample",
+                  cols=None, partial="pad"):
+        """Return a SweepArray viewing flat data swept over controls.
+
+        Arguments:
+            flat: array of the sweep data, first axis serialized in the
+                order of controls (outermost first), then npts samples.
+            controls: list of (dim name, coordinate array), outermost first.
+        Keyword arguments:
+            npts: Int. Samples per sweep point. Default: inferred from the
+                lengths (complete sweep assumed, like deserialize_data).
+                Set it to read aborted sweeps.
+            sample: name of the sample dim, or None if npts is 1 and no
+                sample dim is wanted.
+            cols: names of trailing dims of flat. Default: "col", "col1"...
+            partial: what to do with an aborted sweep. "pad" (default):
+                copy into the full shape, NaN-padded and masked. "drop":
+                view only the complete points of the outermost control
+                (no copy); its coordinate is cut to match.
+        """
+        flat   = np.asanyarray(flat)
+        nc     = [len(coord) for name, coord in controls]
+        npts   = npts or max(len(flat)//max(int(np.prod(nc)), 1), 1)
+        tail   = flat.shape[1:]
+        shape  = tuple(nc) + (npts,) + tail
+        full   = int(np.prod(nc))*npts
+        mask   = None
+        if len(flat) > full:
+            raise ValueError("{} rows for a sweep of {}.".format(
+                len(flat), full))
+        if len(flat) == full:
+            values = flat.reshape(shape)        # a view if flat is regular
+        elif partial == "drop":                 # aborted: complete part
+            inner  = int(np.prod(nc[1:]))*npts
+            nc[0]  = len(flat)//inner
+            shape  = tuple(nc) + (npts,) + tail
+            values = flat[:nc[0]*inner].reshape(shape)
+            controls = [(controls[0][0], controls[0][1][:nc[0]])]\
+                + list(controls[1:])
+        elif partial == "pad":                  # aborted: pad and mask
+            values = np.full((full,) + tail, np.nan)
+            values[:len(flat)] = flat
+            mask = np.zeros((full,) + tail, dtype=bool)
+            mask[len(flat):] = True
+            values, mask = values.reshape(shape), mask.reshape(shape)
+        else:
+            raise ValueError("partial must be 'pad' or 'drop'.")
+
+        dims   = [name for name, coord in controls] + [sample]
+        if cols is None:
+            cols = ["col" + (str(k) if k else "") for k in range(len(tail))]
+        dims  += list(cols)
+        coords = {name: np.asarray(coord) for name, coord in controls}
+        if sample is None:
+            if npts != 1:
+                raise ValueError("No sample dim but npts = {}.".format(npts))
+            values = values.reshape(values.shape[:len(nc)] + tail)
+            mask   = None if mask is None else mask.reshape(values.shape)
+            dims.remove(None)
+        return cls(values, dims, coords, mask)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def ndim(self):
+        return self.values.ndim
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return "<SweepArray dims={} shape={}{}>".format(
+            self.dims, self.shape, "" if self.mask is None else " masked")
+
+    def __array__(self, dtype=None, copy=None):
+        return self.values if dtype is None else self.values.astype(dtype)
+
+    def __getitem__(self, index):
+        """Positional indexing of the values (plain array)."""
+        return self.values[index]
+
+    def masked(self):
+        """Return values as a numpy masked array."""
+        return np.ma.MaskedArray(self.values, mask=(
+            np.ma.nomask if self.mask is None else self.mask))
+
+    def complete(self, dim=None):
+        """Return a bool array along dim (default: the first one), True
+        where no sample is missing."""
+        axis = self.dims.index(dim or self.dims[0])
+        n = self.shape[axis]
+        if self.mask is None:
+            return np.ones(n, dtype=bool)
+        other = tuple(k for k in range(self.ndim) if k != axis)
+        return ~self.mask.any(axis=other)
+
+    def index(self, dim, value):
+        """Return the position along dim of the coordinate nearest value.
+
+        Monotonic coordinates are bisected; others (e.g. hysteresis sweeps
+        going up and down) return the first nearest point.
+        """
+        coord = self.coords[dim]
+        if len(coord) > 1 and np.all(np.diff(coord) > 0):
+            k = int(np.clip(np.searchsorted(coord, value), 1, len(coord)-1))
+            return k if coord[k] - value < value - coord[k-1] else k - 1
+        return int(np.argmin(np.abs(coord - value)))
+
+    def isel(self, **indexers):
+        """Return a selection by position, e.g. isel(B=3) or
+        isel(B=slice(0, 10)). Integer positions drop the dim; slices keep
+        views of the values."""
+        index  = [slice(None)]*self.ndim
+        dims   = list(self.dims)
+        coords = dict(self.coords)
+        for dim, k in indexers.items():
+            index[self.dims.index(dim)] = k
+            if isinstance(k, slice):
+                if dim in coords:
+                    coords[dim] = coords[dim][k]
+            else:
+                dims.remove(dim)
+                coords.pop(dim, None)
+        index  = tuple(index)
+        values = self.values[index]
+        mask   = None if self.mask is None else self.mask[index]
+        if not dims:
+            return values
+        return SweepArray(values, dims, coords, mask)
+
+    def sel(self, **indexers):
+        """Return a selection by coordinate value (nearest point).
+
+        Values select one point and drop the dim, e.g. sel(B=0.01).
+        slice(lo, hi) keeps points with lo <= coordinate <= hi: a view for
+        monotonic coordinates, a copy otherwise.
+        """
+        sweep = self
+        for dim, value in indexers.items():
+            if not isinstance(value, slice):
+                sweep = sweep.isel(**{dim: sweep.index(dim, value)})
+                continue
+            coord = sweep.coords[dim]
+            lo = -np.inf if value.start is None else value.start
+            hi = np.inf if value.stop is None else value.stop
+            if len(coord) < 2 or np.all(np.diff(coord) > 0):
+                k0 = np.searchsorted(coord, lo, side="left")
+                k1 = np.searchsorted(coord, hi, side="right")
+                sweep = sweep.isel(**{dim: slice(k0, k1)})
+            else:
+                k = np.flatnonzero((coord >= lo) & (coord <= hi))
+                axis = sweep.dims.index(dim)
+                coords = dict(sweep.coords)
+                coords[dim] = coord[k]
+                sweep = SweepArray(np.take(sweep.values, k, axis=axis),
+                                   sweep.dims, coords,
+                                   None if sweep.mask is None else
+                                   np.take(sweep.mask, k, axis=axis))
+        return sweep
+
+def from_data(data, controls, targets, npts=None, sample="sample",
+              partial="pad"):
+    """Return a dict of SweepArrays of target keys swept over control keys.
+
+    Labelled, view-based replacement of datafile.deserialize_data.
+
+    Arguments:
+        data: dict-like of arrays.
+        controls: list of control keys (coordinates), outermost first.
+        targets: list of keys to view.
+    Keyword arguments:
+        npts, sample, partial: See SweepArray.from_flat.
+    """
+    ctrl = [(c, np.asarray(data[c])) for c in controls]
+    return {t: SweepArray.from_flat(data[t], ctrl, npts, sample,
+                                    partial=partial)
+            for t in targets}
@@ -11,6 +11,10 @@ cmd_params = {
                      "function": "fit_datafile"},
     "conv_tdsbin": {"module": "cryomem.common.datafile",
                     "function": "conv_tdsbin"},
+    "conv_tdsbin_bulk": {"module": "cryomem.common.datafile",
+                         "function": "conv_tdsbin_bulk"},
+    "catalog":  {"module": "cryomem.common.catalog", "class": "Catalog",
+                 "methods": ["update", "query", "fields"]},
 
     "cmdaq":    {"module": "cryomem.cmtools.lib.daq_dipstick",
                  "functions": ["reset", "set_dccurrent", "set_field",
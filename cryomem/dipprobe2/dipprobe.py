@@ -108,6 +108,8 @@ class DipProbe(DipProbeBase):
             range -- sweep value range. Format: start step stop [step stop
             ...]
             read -- measurement properties
+            datafile_stream -- write data to the datafile during the sweep
+            instead of keeping it in memory. Default: no.
         """
         # load config if not present
         if not hasattr(self.config, "content"):
@@ -135,6 +137,9 @@ class DipProbe(DipProbeBase):
             # Pre-loop operation
             #self.init_prop(seq_param['init'])
             val = self.get_dev_val(v)   # dummy read
+            if seq_param.get("datafile_stream", False):
+                self.open_datawriter(filename=seq_param["datafile_name"],
+                                     datafile_increment=seq_param["datafile_increment"])
 
             # Measurement loop
             tick0 = time.time()
@@ -161,6 +166,7 @@ class DipProbe(DipProbeBase):
                                        datafile_increment=seq_param["datafile_increment"])
                     else:
                         print("Discarding data.")
+                        self.discard_data()
                     #self.close_plot()
                     return tick
 
@@ -10,7 +10,7 @@ import pandas as pd
 from ..common.plotproc import PlotProc
 from .config import Config
 from ..common.numstr import isnumstr
-from ..common.datafile import save_data
+from ..common.datafile import save_data, DataWriter
 
 
 class DeviceProp:
@@ -106,6 +106,7 @@ class DipProbeBase:
         #self.seq_param = {}
         #self.data = []
         self.data = {}		# dictionary-type data
+        self.datawriter = None  # streaming writer (see open_datawriter)
         #self.devprops = []
         self.devprop = {}
         self.proplist = []
@@ -203,6 +204,13 @@ class DipProbeBase:
 
 	data: dict.
 	"""
+        # stream to datafile instead if a writer is open
+        if self.datawriter is not None:
+            self.datawriter.write(data)
+            if kwargs.get("show", False):
+                print("Data:", str(data)[:70])
+            return
+
         # add to data arrays
         #self.data = self.data.append(data, ignore_index=True)
         for key in data:
@@ -281,7 +289,8 @@ class DipProbeBase:
 
         plt.pause(0.05)
 
-    def save_data(self, **kwargs):
+    def _get_datapath(self, **kwargs):
+        """Return a new datafile path from filename/datafile_increment."""
         dataname =  kwargs.get("filename", "testdata.txt")
         increment = kwargs.get("datafile_increment", False)
 
@@ -291,7 +300,7 @@ class DipProbeBase:
 
         # look for the last number of datafiles and increase it.
         if increment:
-            fnlist = list(Path(self.dataroot).glob('*.zip'))
+            fnlist = list(Path(self.dataroot).glob('*.' + self.dataext))
             if len(fnlist) == 0:
                 n = 1
                 print ('1st datafile.')
@@ -310,6 +319,36 @@ class DipProbeBase:
         # do not prefix the datafile name
         else:
             datapath = "{}/{}.{}".format(self.dataroot, dataname, self.dataext)
+        return datapath
+
+    def open_datawriter(self, **kwargs):
+        """Stream data appended from now on to a datafile.
+
+        Keeps memory bounded for long sweeps. save_data() finalizes the file.
+        Keyword arguments: same as save_data.
+        """
+        datapath = self._get_datapath(**kwargs)
+        print("Streaming data to: {}...".format(datapath))
+        self.datawriter = DataWriter(datapath, md=self.config.content)
+        return datapath
+
+    def discard_data(self):
+        """Drop accumulated data, including a streamed datafile."""
+        if self.datawriter is not None:
+            self.datawriter.close()
+            os.remove(self.datawriter.fname)
+            self.datawriter = None
+        self.data = {}
+
+    def save_data(self, **kwargs):
+        # finalize streamed datafile
+        if self.datawriter is not None:
+            print("Saving data to: {}...".format(self.datawriter.fname))
+            self.datawriter.close()
+            self.datawriter = None
+            return
+
+        datapath = self._get_datapath(**kwargs)
         # save data and metadata to zip
         print("Saving data to: {}...".format(datapath))
         save_data(datapath, self.data, md=self.config.content)
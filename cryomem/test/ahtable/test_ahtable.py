@@ -0,0 +1,34 @@
+"""Tests of the AH lookup table cache (small, quick tables).
+
+Run: python -m pytest cryomem/test/ahtable
+"""
+import numpy as np
+import os
+from cryomem.cmtools.lib.jjiv import AHTable, _v_ah_norm
+
+def test_cachefile_per_settings(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    small = dict(xmax=3, gmin=0.5, gmax=20)
+    t1 = AHTable(tol=1e-2, **small)
+    t2 = AHTable(tol=5e-3, **small)
+    assert t1.cachefile != t2.cachefile
+    assert os.path.dirname(t1.cachefile) == str(
+        tmp_path/".cache"/"cryomem")
+    assert os.path.exists(t1.cachefile) and os.path.exists(t2.cachefile)
+
+    t3 = AHTable(tol=1e-2, build=False, **small)   # same settings: reused
+    assert t3.cachefile == t1.cachefile and t3.load()
+    assert np.array_equal(t3.f, t1.f)
+
+    x = np.linspace(0, 3, 50)
+    for g in (0.6, 1.3, 15.):
+        assert np.abs(t2(x, g) - _v_ah_norm(x, g, rtol=1e-6)).max() < 5e-3
+
+def test_v_ah_matches_quad():
+    from cryomem.cmtools.lib.jjiv import v_ah, v_ah_quad
+    ic, rn, io, vo = 10e-6, 2.0, 1e-7, 1e-6
+    i = np.linspace(-3, 3, 13)*ic
+    for t in (40., 10.):                    # quad overflows at lower t
+        v = v_ah(i, ic, rn, io, vo, t)
+        assert np.allclose(v, v_ah_quad(i, ic, rn, io, vo, t),
+                           rtol=1e-4, atol=1e-6*ic*rn)
@@ -0,0 +1,43 @@
+"""Tests of the datafile catalog.
+
+Run: python -m pytest cryomem/test/catalog
+"""
+import numpy as np
+import os
+from cryomem.common import datafile
+from cryomem.common.catalog import Catalog
+
+def _save(path, num, chip, bmax, npts):
+    fname = str(path/"{:03d}_BIV_B160607_chip{}_A01_4000OeP.zip".format(
+        num, chip))
+    iv = np.random.default_rng(num).normal(size=(npts, 2))
+    datafile.save_data(fname, {"B": np.linspace(0, bmax, 11), "IV": iv},
+                       md={"T": 4.2, "sample": {"chip": chip}})
+    return fname
+
+def test_update_and_query(tmp_path):
+    _save(tmp_path, 1, 23, 0.5, 100)
+    _save(tmp_path, 2, 23, 0.1, 5000)               # large text member
+    _save(tmp_path, 3, 24, 0.5, 100)
+    cat = Catalog(str(tmp_path/"catalog.sqlite"))
+    counts = cat.update(str(tmp_path))
+    assert counts == {"indexed": 3, "unchanged": 0, "removed": 0,
+                      "failed": 0}
+
+    res = cat.query("name.chip = 23", "B.span > 0.3")
+    assert [os.path.basename(p)[:3] for p in res["path"]] == ["001"]
+    res = cat.query("md.sample.chip = 24")
+    assert [os.path.basename(p)[:3] for p in res["path"]] == ["003"]
+
+    # shapes only where the headers give them
+    res = cat.query("name.num >= 1", order="name.num",
+                    columns=["shape.B", "shape.IV"])
+    assert list(res["shape.B"]) == ["(11,)"]*3
+    assert list(res["shape.IV"].isna()) == [False, True, False]
+    assert res["shape.IV"][0] == "(100, 2)"
+
+    # rescans are incremental
+    os.remove(res["path"][2])
+    assert cat.update(str(tmp_path)) == {"indexed": 0, "unchanged": 2,
+                                         "removed": 1, "failed": 0}
+    cat.close()
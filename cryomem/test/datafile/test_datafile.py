@@ -0,0 +1,294 @@
+"""Tests of zipped datafiles written in append mode and by DataWriter.
+
+Run: python -m pytest cryomem/test/datafile
+"""
+import numpy as np
+import os, shutil, zipfile
+from io import BytesIO
+from cryomem.common import datafile
+
+here = os.path.dirname(os.path.abspath(__file__))
+tdsbin = "036_VItrace-HI_B160607_chip23_A11_3500OeP"
+
+def test_append_member_names_unique(tmp_path):
+    fname = str(tmp_path/"001_append.zip")
+    datafile.save_data(fname, {"B": np.arange(3.)}, md={"a": 1, "b": 2})
+    datafile.save_data(fname, {"B": np.arange(3.)}, mode="a", md={"b": 3})
+    datafile.save_data(fname, {"B": np.arange(3.)}, mode="a", fmt="npy",
+                       md={"c": 4})
+    with datafile.DataWriter(fname, mode="a", md={"d": 5}) as dw:
+        dw.append("B", 1.)
+
+    with zipfile.ZipFile(fname) as zf:
+        names = zf.namelist()
+    assert len(names) == len(set(names))
+
+    data, md = datafile.load_data(fname)
+    assert data["B"].shape == (10,)
+    assert dict(md) == {"a": 1, "b": 3, "c": 4, "d": 5}
+    assert dict(datafile.load_md(fname)) == dict(md)
+
+def test_datawriter_matches_in_memory_stacking(tmp_path):
+    steps = [{"B": 0.1*k, "V": np.arange(4.) + k,
+              "IV": np.full((5, 2), float(k))} for k in range(3)]
+
+    # in-memory accumulation as in DipProbeBase.append_data
+    mem = {}
+    for step in steps:
+        for key in step:
+            arr = np.array(step[key])
+            mem[key] = arr if key not in mem else np.vstack((mem[key], arr))
+    fname1 = str(tmp_path/"001_mem.zip")
+    datafile.save_data(fname1, mem)
+
+    fname2 = str(tmp_path/"002_stream.zip")
+    with datafile.DataWriter(fname2) as dw:
+        for step in steps:
+            dw.write(step)
+
+    data1, md1 = datafile.load_data(fname1)
+    data2, md2 = datafile.load_data(fname2)
+    assert set(data1) == set(data2)
+    for key in data1:
+        assert data1[key].shape == data2[key].shape, key
+        assert np.allclose(data1[key], data2[key]), key
+
+def test_npy_members_stored_by_default(tmp_path):
+    fname = str(tmp_path/"001_npy.zip")
+    datafile.save_data(fname, {"V": np.arange(100.)}, fmt="npy")
+    with zipfile.ZipFile(fname) as zf:
+        assert zf.getinfo("V.npy").compress_type == zipfile.ZIP_STORED
+
+    data, md = datafile.load_data(fname, mmap_mode="r")
+    assert isinstance(data["V"], np.memmap)
+    assert np.array_equal(data["V"], np.arange(100.))
+
+def test_conv_tdsbin_bulk_ignores_other_dat(tmp_path):
+    for ext in (".dat", ".txt", ".osccfg"):
+        shutil.copy(os.path.join(here, tdsbin + ext), str(tmp_path))
+    (tmp_path/"037_other.dat").write_bytes(b"not a tdsbin file")
+
+    summary = datafile.conv_tdsbin_bulk(str(tmp_path), jobs=1)
+    assert summary["converted"] == 1
+    assert summary["failed"] == {}
+    assert [os.path.basename(fi) for fi in summary["ignored"]] \
+        == ["037_other.dat"]
+    data, md = datafile.load_data(str(tmp_path/(tdsbin + ".zip")))
+    assert data["IV"].shape[1] == 2
+
+def test_adc_members_deflated_and_round_trip(tmp_path):
+    t = np.arange(2000)
+    codes = np.column_stack((np.round(100*np.sin(t/300.)),
+                             np.round(50*np.cos(t/300.)))).astype(np.int16)
+    adc = datafile.AdcArray(codes, yinc=[1e-3, 2e-3], yor=[0, 1], yref=[0, 0])
+    fname = str(tmp_path/"001_adc.zip")
+    with datafile.DataWriter(fname) as dw:
+        dw.append("IV", adc)
+        dw.append("B", np.arange(3.))
+
+    with zipfile.ZipFile(fname) as zf:
+        info = [zi for zi in zf.infolist() if zi.filename.endswith(".adc")]
+        assert len(info) == 1
+        assert info[0].compress_type == zipfile.ZIP_DEFLATED
+        assert info[0].compress_size < codes.nbytes/10
+
+    data, md = datafile.load_data(fname)
+    assert np.allclose(data["IV"], adc.scaled())
+    raw, md = datafile.load_data(fname, raw=True)
+    assert isinstance(raw["IV"], datafile.AdcArray)
+    assert np.array_equal(raw["IV"].codes, codes)
+
+def test_h5_append_matches_zip(tmp_path):
+    steps = [({"B": np.arange(7.), "T": 4.2}, {"a": 1, "b": 2}),
+             ({"B": 9.0, "T": 4.3}, {"b": 3}),
+             ({"B": np.arange(2.)}, {"c": 4})]
+    for ext in ("zip", "h5"):
+        fname = str(tmp_path/("001_append." + ext))
+        for k, (data, md) in enumerate(steps):
+            datafile.save_data(fname, data, mode="a" if k else "w", md=md,
+                               fmt="npy")
+        data, md = datafile.load_data(fname)
+        assert np.array_equal(data["B"], np.r_[np.arange(7.), 9., 0., 1.])
+        assert np.array_equal(data["T"], [4.2, 4.3])
+        assert dict(md) == {"a": 1, "b": 3, "c": 4}
+
+def test_text_members_like_loadtxt(tmp_path):
+    texts = {"blank": b"\r\n\r\n1.0 2.0\r\n3.0 4.0\r\n",
+             "comments": b"# I V\n1.0 2.0\n# step 2\n3.0 4.0  # last\n\n"}
+    fname = str(tmp_path/"001_text.zip")
+    with zipfile.ZipFile(fname, "w") as zf:
+        for key in texts:
+            zf.writestr(key + ".txt", texts[key])
+
+    data, md = datafile.load_data(fname)
+    for key in texts:
+        expected = np.loadtxt(BytesIO(texts[key]))
+        assert data[key].shape == expected.shape == (2, 2), key
+        assert np.array_equal(data[key], expected), key
+
+def test_scan_and_virtual_data_with_large_text_members(tmp_path):
+    iv = [np.random.default_rng(k).normal(size=(4000 + k, 2)) for k in range(2)]
+    fnames = []
+    for k in range(2):
+        fnames.append(str(tmp_path/"{:03d}_BIV.zip".format(k + 1)))
+        datafile.save_data(fnames[-1], {"B": np.arange(3.) + k, "IV": iv[k]},
+                           md={"k": k})
+
+    info = datafile.scan_file(fnames[0])
+    assert info["shape.B"] == (3,)
+    assert info["shape.IV"] == (None, 2)            # rows unknown until read
+
+    with datafile.open_data(fnames) as vd:
+        assert vd.nrows("B") == 6
+        assert vd.nrows("IV") == 8001
+        rows = vd.read("IV", 3990, 4010)
+        assert rows.shape == (20, 2)
+        assert np.allclose(rows, np.concatenate(iv)[3990:4010], rtol=1e-6)
+        assert np.allclose(vd["IV"], np.concatenate(iv), rtol=1e-6)
+
+def test_streamed_chunks_memory_mapped(tmp_path):
+    fname = str(tmp_path/"001_stream.zip")
+    iv = np.arange(600.).reshape(100, 3, 2)
+    with datafile.DataWriter(fname, chunk_bytes=1000) as dw:
+        for k in range(len(iv)):
+            dw.write({"B": 0.1*k, "IV": iv[k]})
+
+    iv = iv.reshape(-1, 2)                          # rows stacked (vstack)
+    data, md = datafile.load_data(fname, mmap_mode="r")
+    chunked = data["IV"]
+    assert isinstance(chunked, datafile.ChunkedArray)
+    assert len(chunked.parts) > 1
+    assert all(isinstance(part, np.memmap) for part in chunked.parts)
+    assert chunked.shape == iv.shape
+    assert np.array_equal(chunked[17], iv[17])
+    assert np.array_equal(chunked[-1, 1], iv[-1, 1])
+    assert np.array_equal(chunked[5:290:7, 1], iv[5:290:7, 1])
+    assert np.array_equal(chunked[::-3], iv[::-3])
+    assert np.array_equal(chunked[[3, 299, 40]], iv[[3, 299, 40]])
+    assert np.array_equal(np.asarray(chunked), iv)
+    assert np.allclose(np.asarray(data["B"]), 0.1*np.arange(100))
+
+def test_conv_tdsbin_npy_memory_mapped(tmp_path):
+    for ext in (".dat", ".txt", ".osccfg"):
+        shutil.copy(os.path.join(here, tdsbin + ext), str(tmp_path))
+    fi = str(tmp_path/(tdsbin + ".dat"))
+    txt, md = datafile.load_data(datafile.conv_tdsbin(
+        fi, str(tmp_path/"txt.zip")))
+    fname = datafile.conv_tdsbin(fi, str(tmp_path/"npy.zip"), fmt="npy")
+
+    with zipfile.ZipFile(fname) as zf:
+        assert all(zi.compress_type == zipfile.ZIP_STORED
+                   for zi in zf.infolist() if zi.filename.endswith(".npy"))
+    data, md = datafile.load_data(fname, mmap_mode="r")
+    assert isinstance(data["IV"], np.memmap)
+    assert np.allclose(data["IV"], txt["IV"], rtol=1e-6)
+    assert np.array_equal(data["B"], txt["B"])
+
+def test_load_tdsbin_matches_old_conversion():
+    data, md = datafile.load_tdsbin(os.path.join(here, tdsbin + ".dat"))
+    old, md_old = datafile.load_data(os.path.join(here, tdsbin + ".zip"))
+    assert np.allclose(data["B"], old["Bapp"], rtol=1e-5)
+    assert np.allclose(data["Ioff"], old["Iapp"], rtol=1e-5)
+    assert np.allclose(data["IV"][:, 0], old["Iarr"].ravel(), rtol=1e-5,
+                       atol=1e-12)
+    assert np.allclose(data["IV"][:, 1], old["Varr"].ravel(), rtol=1e-5,
+                       atol=1e-12)
+
+def test_iter_tdsbin_blocks_match_load_tdsbin():
+    fname = os.path.join(here, tdsbin + ".dat")
+    data, md = datafile.load_tdsbin(fname)
+    blocks = list(datafile.iter_tdsbin(fname, chunk=7))
+    assert len(blocks) == -(-len(data["B"])//7)
+    c = np.concatenate([cblock for cblock, i, v in blocks])
+    i = np.concatenate([i for cblock, i, v in blocks])
+    v = np.concatenate([v for cblock, i, v in blocks])
+    assert np.array_equal(c[:, 0], data["B"])
+    assert np.allclose(i.ravel(), data["IV"][:, 0], rtol=1e-12, atol=0)
+    assert np.allclose(v.ravel(), data["IV"][:, 1], rtol=1e-12, atol=0)
+
+    trimmed = list(datafile.iter_tdsbin(fname, chunk=100, ltrim=2, rtrim=3))
+    assert np.array_equal(trimmed[0][0][:, 0], data["B"][2:-3])
+
+def test_open_data_reads_members_on_demand(tmp_path):
+    fname = str(tmp_path/"001_lazy.zip")
+    datafile.save_data(fname, {"B": np.arange(3.), "V": np.ones((4, 2))},
+                       md={"a": 1})
+    with datafile.open_data(fname) as lazy:
+        assert sorted(lazy) == ["B", "V"]
+        assert dict(lazy.md) == {"a": 1}
+        assert lazy._data == {}                     # nothing parsed yet
+        assert np.array_equal(lazy["B"], np.arange(3.))
+        assert list(lazy._data) == ["B"]
+        lazy["C"] = np.zeros(2)                     # in memory only
+        del lazy["V"]
+        assert sorted(lazy) == ["B", "C"]
+    data, md = datafile.load_data(fname)
+    assert sorted(data) == ["B", "V"]
+
+def test_stored_npy_memory_mapped(tmp_path):
+    fname = str(tmp_path/"001_mmap.zip")
+    iv = np.arange(200.).reshape(100, 2)
+    datafile.save_data(fname, {"IV": iv, "B": np.arange(100.)}, fmt="npy")
+
+    data, md = datafile.load_data(fname, mmap_mode="c")
+    assert isinstance(data["IV"], np.memmap)
+    assert data["IV"].offset % datafile.ZIP_ALIGN == 0
+    data["IV"][0] = -1                              # copy on write
+    again, md = datafile.load_data(fname)
+    assert np.array_equal(again["IV"], iv)
+
+    datafile.save_data(fname, {"IV": iv}, fmt="npy", compress=True)
+    data, md = datafile.load_data(fname, mmap_mode="r")
+    assert not isinstance(data["IV"], np.memmap)    # deflated: read
+    assert np.array_equal(data["IV"], iv)
+
+def test_load_data_cache(tmp_path):
+    from cryomem.common.datacache import DataCache
+    fname = str(tmp_path/"001_cache.zip")
+    datafile.save_data(fname, {"B": np.arange(3.)}, md={"a": 1})
+    cache = DataCache()
+
+    data, md = datafile.load_data(fname, cache=cache)
+    data2, md2 = datafile.load_data(fname, cache=cache)
+    assert cache.stats()["hits"] == 1
+    assert np.array_equal(data2["B"], np.arange(3.))
+    assert not data2["B"].flags.writeable
+    data2["new"] = 1                                # caller's copy only
+    assert "new" not in datafile.load_data(fname, cache=cache)[0]
+
+    datafile.save_data(fname, {"B": np.arange(5.)}, md={"a": 2})
+    os.utime(fname, ns=(0, os.stat(fname).st_mtime_ns + 10**9))
+    data3, md3 = datafile.load_data(fname, cache=cache)
+    assert len(data3["B"]) == 5 and md3["a"] == 2   # changed file reloaded
+
+def test_load_data_disk_cache(tmp_path):
+    from cryomem.common.datacache import DataCache
+    fname = str(tmp_path/"001_cache.zip")
+    datafile.save_data(fname, {"IV": np.ones((10, 2))}, md={"a": 1})
+    cachedir = str(tmp_path/"cache")
+    datafile.load_data(fname, cache=DataCache(cachedir=cachedir))
+    cache = DataCache(cachedir=cachedir)            # e.g. a new session
+    data, md = datafile.load_data(fname, cache=cache)
+    assert cache.stats()["disk_hits"] == 1 and cache.stats()["misses"] == 0
+    assert np.array_equal(data["IV"], np.ones((10, 2))) and md["a"] == 1
+
+def test_load_many(tmp_path):
+    fnames = []
+    for k in range(5):
+        fnames.append(str(tmp_path/"{:03d}_BIV.zip".format(k + 1)))
+        datafile.save_data(fnames[-1], {"B": np.full(3, k), "V": np.ones(4)},
+                           md={"k": k})
+    bad = tmp_path/"006_BIV.zip"
+    bad.write_bytes(b"not a zip")
+    calls = []
+
+    res = datafile.load_many(str(tmp_path), workers=3,
+                             progress=lambda n, ntot, f: calls.append(n))
+    assert len(res) == 6 and sorted(calls) == list(range(1, 7))
+    for k in range(5):
+        data, md, err = res[k]
+        assert err is None and md["k"] == k and data["B"][0] == k
+    assert res[5][0] is None and res[5][2] is not None
+
+    res = datafile.load_many(fnames, keys="B")
+    assert all(sorted(data) == ["B"] for data, md, err in res)
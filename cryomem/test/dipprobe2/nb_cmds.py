@@ -6,6 +6,7 @@ from cryomem.analysis.fit_datafile import fit_datafile
 from cryomem.analysis.build_curve import build_curve
 from cryomem.common.plothyst import plothyst
 import cryomem.common.datafile as datafile
+from cryomem.common.sweeparray import SweepArray
 from cryomem.analysis.jj_curves import airypat_easy
 from cryomem.fab.wedge import Wedge
 import mylib
@@ -59,10 +60,9 @@ def process_new_datafiles(datafiles, ignore):
                 # subplot 2: a sample IV
                 data0, md0  = datafile.load_data(dataf)
                 ind         = 0
-                data0['I'], data0['V'] = data0['IV'][:, 0], data0['IV'][:, 1]
-                IV = datafile.deserialize_data(data0, ['B'], ['I', 'V'])
-                x           = IV["I"][ind]
-                y           = IV["V"][ind]
+                IV = SweepArray.from_flat(data0['IV'], [('B', data0['B'])])
+                x           = IV[ind, :, 0]
+                y           = IV[ind, :, 1]
                 plt.subplot(122)
                 plt.plot(x, y, "o")
 
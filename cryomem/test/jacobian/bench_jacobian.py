@@ -0,0 +1,72 @@
+"""Benchmark curve fits with finite-difference vs analytic Jacobians.
+
+Counts model evaluations and wall time per curve for the RSJ fit of the
+IVs in ../dipprobe2/data and for Airy/Fraunhofer fits of synthetic data.
+Run from this directory: python bench_jacobian.py
+"""
+import numpy as np
+import glob, time
+from scipy.optimize import curve_fit
+from cryomem.common import datafile
+from cryomem.common.sweeparray import SweepArray
+from cryomem.analysis import jjiv2, jj_curves
+from cryomem.analysis.fraunhoferpat import FraunhoferPat
+
+class Counted:
+    """Model wrapper counting evaluations."""
+    def __init__(self, func):
+        self.func, self.n = func, 0
+
+    def __call__(self, *args):
+        self.n += 1
+        return self.func(*args)
+
+def bench(name, fits):
+    """Run fits (list of (func, jac or None, x, y, guess, kwargs)) twice."""
+    for label in ("finite diff", "analytic"):
+        f_evals = j_evals = 0
+        t = time.time()
+        for func, jac, x, y, guess, kwargs in fits:
+            f = Counted(func)
+            j = Counted(jac) if label == "analytic" else None
+            if j:
+                kwargs = dict(kwargs, jac=j)
+            curve_fit(f, x, y, guess, **kwargs)
+            f_evals += f.n
+            j_evals += j.n if j else 0
+        t = (time.time() - t)/len(fits)
+        print("{:10} {:12} evals/curve: {:6.1f} model + {:5.1f} jac, "
+              "{:6.2f} ms/curve".format(name, label, f_evals/len(fits),
+                                        j_evals/len(fits), t*1e3))
+
+def rsj_fits():
+    fits, cols = [], [0, 1, 2, 4]               # io is fixed
+    for fname in sorted(glob.glob("../dipprobe2/data/0*.zip")):
+        data, md = datafile.load_data(fname)
+        iv = SweepArray.from_flat(data["IV"], [("B", data["B"])])
+        for i, v in zip(iv.values[..., 0], iv.values[..., 1]):
+            di = np.median(np.abs(np.diff(i)))
+            func = lambda _i, icp, icn, r, vo: \
+                jjiv2.v_rsj_asym(_i, icp, icn, r, 0, vo)
+            jac = lambda _i, icp, icn, r, vo, di=di: \
+                jjiv2.v_rsj_asym_jac(_i, icp, icn, r, 0, vo, di)[:, cols]
+            bounds = ([0, -np.inf, -np.inf, -np.inf],
+                      [np.inf, 0, np.inf, np.inf])
+            fits.append((func, jac, i, v, jjiv2.quickguess_rsj(i, v),
+                         {"bounds": bounds, "method": "trf"}))
+    return fits
+
+def pattern_fits(func, jac, p, guess, n=50):
+    rng = np.random.default_rng(0)
+    x = np.linspace(-3, 3, 301)
+    return [(func, jac, x, func(x, *p) + 0.02*rng.normal(size=len(x)),
+             guess, {}) for k in range(n)]
+
+if __name__ == "__main__":
+    bench("RSJ", rsj_fits())
+    bench("Airy", pattern_fits(jj_curves.airypat_easy,
+                               jj_curves.airypat_easy_jac,
+                               [1, 0.2, 1.5], [0.9, 0.1, 1.3]))
+    fp = FraunhoferPat(np.zeros(2), np.ones(2))
+    bench("Fraunhofer", pattern_fits(fp.func, fp.jac, [1, 0.8, 0.2],
+                                     [0.9, 0.7, 0.1]))
@@ -0,0 +1,53 @@
+"""Tests of the analytic Jacobians against central differences.
+
+Points are kept off the kinks (switching currents, pattern nodes), where
+the models are not differentiable.
+
+Run: python -m pytest cryomem/test/jacobian
+"""
+import numpy as np
+from cryomem.analysis import jj_curves, jjiv2
+from cryomem.analysis.fraunhoferpat import FraunhoferPat
+
+def numjac(func, x, p, rel=1e-6):
+    """Return the central-difference Jacobian of func(x, *p)."""
+    p = np.asarray(p, dtype=float)
+    cols = []
+    for k in range(len(p)):
+        h = rel*max(abs(p[k]), 1)
+        dp = np.zeros(len(p)); dp[k] = h
+        cols.append((func(x, *(p + dp)) - func(x, *(p - dp)))/(2*h))
+    return np.column_stack(cols)
+
+def test_rsj_asym_jac():
+    p = [10., -8., 2., 0.5, 0.1]
+    i = np.linspace(-30, 30, 241)
+    x = i - p[3]
+    i = i[(np.abs(x - p[0]) > 0.5) & (np.abs(x - p[1]) > 0.5)]
+    jac = jjiv2.v_rsj_asym_jac(i, *p)
+    assert np.allclose(jac, numjac(jjiv2.v_rsj_asym, i, p), rtol=1e-5,
+                       atol=1e-6)
+    assert np.array_equal(jj_curves.V_RSJ_asym_jac(i, *p), jac)
+
+    q = [10., 2., 0.5, 0.1]
+    i = i[np.abs(np.abs(i - q[2]) - q[0]) > 0.5]
+    assert np.allclose(jjiv2.v_rsj_jac(i, *q), numjac(jjiv2.v_rsj, i, q),
+                       rtol=1e-5, atol=1e-6)
+
+def test_airypat_jacs():
+    x = np.linspace(-2.9, 3.1, 61) + 0.013          # central lobe
+    p = [5., 0.3, 0.1]
+    assert np.allclose(jj_curves.airypat_jac(x, *p),
+                       numjac(jj_curves.airypat, x, p), rtol=1e-5, atol=1e-7)
+    p = [5., 0.1, 4.]                               # Ic, Hcenter, Hnode
+    x = np.linspace(-3, 3, 61) + 0.013
+    assert np.allclose(jj_curves.airypat_easy_jac(x, *p),
+                       numjac(jj_curves.airypat_easy, x, p), rtol=1e-5,
+                       atol=1e-7)
+
+def test_fraunhofer_jac():
+    x = np.linspace(-0.9, 1.1, 41) + 0.013          # central lobe
+    p = [5., 0.8, 0.1]
+    pat = FraunhoferPat(x, np.ones_like(x))
+    assert np.allclose(pat.jac(x, *p), numjac(pat.func, x, p), rtol=1e-5,
+                       atol=1e-7)
@@ -0,0 +1,46 @@
+"""Tests of the vectorized RSJ IV array analysis.
+
+Run: python -m pytest cryomem/test/jjivarray2
+"""
+import numpy as np
+from cryomem.analysis import jjiv2, jjivarray2
+
+def _ivs():
+    """Return (N, M) I (uA) and V (uV) of asymmetric RSJ IVs with noise,
+    Ic+ from 10 down to 5 uA."""
+    rng = np.random.default_rng(0)
+    i = np.tile(np.linspace(-30, 30, 401), (6, 1))
+    icp = np.linspace(10, 5, 6)[:, None]
+    icn = -0.8*icp
+    x2 = i*i
+    v = 2.0*(np.sqrt(np.maximum(x2 - icp**2, 0)*(i > icp))
+             - np.sqrt(np.maximum(x2 - icn**2, 0)*(i < icn))) + 0.1
+    return i, v + 0.02*rng.normal(size=v.shape)
+
+def test_quickguess_arr_matches_scalar():
+    i, v = _ivs()
+    guess = jjivarray2.quickguess_rsj_arr(i, v)
+    for k in range(len(i)):
+        assert np.allclose(guess[k], jjiv2.quickguess_rsj(i[k], v[k]),
+                           rtol=1e-10, atol=1e-12), k
+
+def test_batched_fit_matches_chain():
+    i, v = _ivs()
+    kwargs = {"model": "rsj_asym", "io": 0, "updateguess": 0.8}
+    chain, _ = jjivarray2.fit2rsj_arr(i, v, **dict(kwargs))
+    batched, _ = jjivarray2.fit2rsj_arr(i, v, method="batched",
+                                        **dict(kwargs))
+    assert np.allclose(chain[:, 0], np.linspace(10, 5, 6), rtol=1e-2)
+    assert np.allclose(batched[:, :3], chain[:, :3], rtol=1e-3)
+    assert np.allclose(batched[:, 3], chain[:, 3], atol=2e-3)   # noise 0.02
+
+def test_parallel_fit_matches_serial():
+    i, v = _ivs()
+    kwargs = {"model": "rsj_asym", "io": 0, "updateguess": 0.8}
+    serial, _ = jjivarray2.fit2rsj_arr(i, v, **dict(kwargs))
+    for chunks in (2, 4):                       # chains seeded per chunk
+        parallel, _ = jjivarray2.fit2rsj_arr(i, v, jobs=2, chunks=chunks,
+                                             **dict(kwargs))
+        assert parallel.shape == serial.shape
+        assert np.allclose(parallel[:, :3], serial[:, :3], rtol=1e-3)
+        assert np.allclose(parallel[:, 3], serial[:, 3], atol=2e-3)
@@ -0,0 +1,46 @@
+"""Tests of ModelCache memoization.
+
+Run: python -m pytest cryomem/test/modelcache
+"""
+import numpy as np
+from cryomem.common.modelcache import ModelCache
+
+ncalls = [0]
+
+def model(x, a, b=1.):
+    ncalls[0] += 1
+    return a*np.asarray(x) + b, {"a": a}
+
+def test_memoize_hits_and_copies():
+    cache = ModelCache(maxitems=2, digits=6)
+    f = cache.memoize(model)
+    x = np.linspace(0, 1, 5)
+    ncalls[0] = 0
+    y, info = f(x, 2.)
+    y[:] = 0                                        # caller's copy
+    y2, info2 = f(x, 2. + 1e-9)                     # same to 6 digits
+    assert ncalls[0] == 1 and np.allclose(y2, 2*x + 1)
+    f(x, 2.1); f(x + 1, 2.); f(x, 2., b=3.)         # distinct keys
+    assert ncalls[0] == 4
+    f(x, 2.)                                        # evicted (maxitems)
+    assert ncalls[0] == 5
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 5
+    assert f.__wrapped__ is model and f.cache is cache
+
+def vc(x, a):
+    ncalls[0] += 1
+    return a*np.asarray(x), a/2
+
+def test_disk_store(tmp_path):
+    x = np.linspace(0, 1, 5)
+    ModelCache(cachedir=str(tmp_path)).call(vc, x, 3.)
+    cache = ModelCache(cachedir=str(tmp_path))      # e.g. a new session
+    ncalls[0] = 0
+    y, half = cache.call(vc, x, 3.)
+    assert ncalls[0] == 0 and cache.stats()["disk_hits"] == 1
+    assert np.allclose(y, 3*x) and half == 1.5
+
+    cache.call(model, x, 3.)                        # dict: memory only
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+    cache.clear()
+    assert not list(tmp_path.glob("*.npz"))
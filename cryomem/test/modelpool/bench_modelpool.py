@@ -0,0 +1,72 @@
+"""Benchmark AH model evaluation: serial, Pool per call and ModelPool.
+
+Per-call time of v_ah on n bias points for
+    serial      v_ah in this process
+    pool/call   a new Pool for every call (the former v_ah_mp)
+    ModelPool   the persistent pool (v_ah_mp) with 2..cpu_count workers
+and one fit2ah_ic_rn_tn fit serial vs on the ModelPool. The pool pays off
+when a call costs much more than its overhead (~1 ms dispatch), i.e. many
+points or low T (large gamma), and only with more than one core.
+Run from this directory: python bench_modelpool.py
+"""
+import numpy as np
+import os, time
+from multiprocessing import Pool
+from cryomem.cmtools.lib import modelpool
+from cryomem.cmtools.lib.jjiv import JJIV, v_ah, v_ah_mp, v_ah_caller
+
+ic, rn, io, vo = 10e-6, 2.0, 0., 1e-7
+
+def per_call(func, nrep=3):
+    """Return the best wall time of func() out of nrep."""
+    best = np.inf
+    for k in range(nrep):
+        t = time.time()
+        func()
+        best = min(best, time.time() - t)
+    return best
+
+def pool_per_call(i, t, nproc):
+    """Former v_ah_mp: start a Pool, map strided slices, tear down."""
+    with Pool(processes=nproc) as pool:
+        res = pool.map(v_ah_caller, [(i[m::nproc], ic, rn, io, vo, t)
+                                     for m in range(nproc)])
+    v = np.zeros(len(i))
+    for m in range(nproc):
+        v[m::nproc] = res[m]
+    return v
+
+def main():
+    ncpu = os.cpu_count() or 1
+    nprocs = sorted({2, max(ncpu, 2)} | ({4} if ncpu >= 4 else set()))
+    print("CPUs: {}".format(ncpu))
+    print("{:>6} {:>5} {:>9} {:>10}".format("n", "T(K)", "serial",
+          "pool/call") + "".join(" {:>7}".format("mp x{}".format(p))
+                                 for p in nprocs))
+    for n in (200, 2500):
+        for t in (40., 4.):
+            i = np.linspace(-3, 3, n)*ic
+            row = [per_call(lambda: v_ah(i, ic, rn, io, vo, t)),
+                   per_call(lambda: pool_per_call(i, t, nprocs[0]))]
+            for p in nprocs:
+                pool = modelpool.get_pool(processes=p)
+                v_ah_mp(i, ic, rn, io, vo, t)           # start workers
+                row.append(per_call(lambda: v_ah_mp(i, ic, rn, io, vo, t)))
+            print("{:6d} {:5.0f}".format(n, t) + " {:9.3f} {:10.3f}".format(
+                *row[:2]) + "".join(" {:7.3f}".format(x) for x in row[2:]))
+
+    # one fit, 400 points at 4 K
+    i = np.linspace(-3, 3, 400)*ic
+    v = v_ah(i, ic, rn, io, vo, 4.) \
+        + 1e-7*np.random.default_rng(0).normal(size=len(i))
+    guess = [ic*1.2, rn*0.9, io, vo, 6.]
+    for label, pool in (("serial", None), ("ModelPool", True)):
+        jj = JJIV(i, v)
+        t0 = time.time()
+        jj.fit2ah_ic_rn_tn(guess, pool=pool)
+        print("fit2ah_ic_rn_tn {:>9}: {:6.2f} s  Ic {:.4e} Rn {:.4f} Tn {:.3f}"
+              .format(label, time.time() - t0, jj.ic, jj.rn, jj.tn))
+    modelpool.close_pool()
+
+if __name__ == "__main__":
+    main()
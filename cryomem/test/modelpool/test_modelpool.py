@@ -0,0 +1,40 @@
+"""Tests of the persistent model pool.
+
+Run: python -m pytest cryomem/test/modelpool
+"""
+import numpy as np
+from cryomem.cmtools.lib.jjiv import v_ah, v_ah_mp, JJIV
+from cryomem.cmtools.lib.modelpool import ModelPool
+
+ic, rn, io, vo, t = 10e-6, 2.0, 1e-7, 1e-6, 10.
+
+def test_map_points_matches_serial():
+    i = np.linspace(-3, 3, 101)*ic
+    v = v_ah(i, ic, rn, io, vo, t)
+    with ModelPool(processes=2, minchunk=8) as pool:
+        assert np.array_equal(pool.map_points(v_ah, i, ic, rn, io, vo, t), v)
+        assert np.array_equal(v_ah_mp(i, ic, rn, io, vo, t, pool), v)
+        # larger input replaces the shared buffers
+        i2 = np.linspace(-3, 3, 301)*ic
+        assert np.array_equal(v_ah_mp(i2, ic, rn, io, vo, t, pool),
+                              v_ah(i2, ic, rn, io, vo, t))
+        assert pool._pool is not None
+    assert pool._pool is None and not pool._shm
+
+def test_short_input_runs_serially():
+    i = np.linspace(-3, 3, 10)*ic
+    with ModelPool(processes=2) as pool:
+        assert np.array_equal(pool.map_points(v_ah, i, ic, rn, io, vo, t),
+                              v_ah(i, ic, rn, io, vo, t))
+        assert pool._pool is None
+
+def test_fit2ah_ic_with_pool():
+    i = np.linspace(-3, 3, 61)*ic
+    v = v_ah(i, ic, rn, io, vo, t)
+    guess = [0.8*ic, rn, io, vo, t]
+    serial, pooled = JJIV(i, v), JJIV(i, v)
+    serial.fit2ah_ic(guess)
+    with ModelPool(processes=2, minchunk=8) as pool:
+        pooled.fit2ah_ic(guess, pool=pool)
+    assert np.isclose(pooled.ic, serial.ic, rtol=1e-8)
+    assert np.isclose(serial.ic, ic, rtol=1e-4)
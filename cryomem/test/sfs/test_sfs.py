@@ -0,0 +1,29 @@
+"""Tests of the batched Buzdin-1982 SFS evaluator.
+
+Run: python -m pytest cryomem/test/sfs
+"""
+import numpy as np
+import pytest
+from cryomem.analysis import sfs
+
+d = np.array([0.5, 1.3, 2.7])
+xi, delta = 1.0, 1.4e-3
+
+@pytest.mark.filterwarnings("ignore::scipy.integrate.IntegrationWarning")
+@pytest.mark.parametrize("t", [4.2, 0.5, -4.2])
+def test_fast_matches_quad(t):
+    vc, phi = sfs.Vc_SFS_B82.__wrapped__(d, xi, delta, t)
+    vc2, phi2 = sfs.Vc_SFS_B82_fast.__wrapped__(d, xi, delta, t)
+    assert np.allclose(vc2, vc, rtol=1e-3)
+    assert np.allclose(phi2, phi, atol=np.pi/49)    # quad: 50-point grid
+
+@pytest.mark.filterwarnings("ignore::scipy.integrate.IntegrationWarning")
+def test_grid_matches_quad():
+    phi = np.linspace(0.1, 3, 5)
+    grid = sfs.IsRn_SFS_B82_grid(phi, d, xi, delta, 4.2)
+    ref = sfs.IsRn_SFS_B82(phi[None, :], d[:, None], xi, delta, 4.2)
+    assert np.allclose(grid, ref, rtol=1e-3, atol=1e-3*np.abs(ref).max())
+
+def test_fit_model_shape():
+    assert sfs.vc_SFS_B82(d, xi, delta, 4.2).shape == d.shape
+    assert np.isscalar(sfs.vc_SFS_B82(1.0, xi, delta, 4.2)[()])
@@ -0,0 +1,49 @@
+"""Tests of SweepArray views of flat sweep data.
+
+Run: python -m pytest cryomem/test/sweeparray
+"""
+import numpy as np
+import pytest
+from cryomem.common.sweeparray import SweepArray, from_data
+
+B = np.linspace(0, 0.04, 5)
+IV = np.arange(5*8*2, dtype=float).reshape(5*8, 2)
+
+def test_complete_sweep_is_a_view():
+    iv = SweepArray.from_flat(IV, [("B", B)])
+    assert iv.dims == ("B", "sample", "col")
+    assert iv.shape == (5, 8, 2)
+    assert np.shares_memory(iv.values, IV)
+    assert iv.complete().all()
+    assert np.array_equal(iv.sel(B=0.011).values, IV[8:16])
+    sub = iv.sel(B=slice(0.01, 0.03))
+    assert np.array_equal(sub.coords["B"], B[1:4])
+    assert np.shares_memory(sub.values, IV)
+
+def test_aborted_sweep_padded_and_masked():
+    iv = SweepArray.from_flat(IV[:35], [("B", B)], npts=8)
+    assert iv.shape == (5, 8, 2)
+    assert list(iv.complete()) == [True]*4 + [False]
+    assert np.array_equal(iv.values[4, :3], IV[32:35])
+    assert np.isnan(iv.values[4, 3:]).all() and iv.mask[4, 3:].all()
+    assert iv.masked()[:4].mask.sum() == 0
+
+def test_aborted_sweep_dropped_without_copy():
+    iv = SweepArray.from_flat(IV[:35], [("B", B)], npts=8, partial="drop")
+    assert iv.shape == (4, 8, 2)
+    assert iv.mask is None
+    assert np.shares_memory(iv.values, IV)
+    assert np.array_equal(iv.coords["B"], B[:4])
+
+def test_from_data_two_controls():
+    data = {"B": np.arange(3.), "I": np.arange(4.),
+            "V": np.arange(3*4*6, dtype=float)}
+    v = from_data(data, ["B", "I"], ["V"], npts=6)["V"]
+    assert v.dims == ("B", "I", "sample")
+    assert np.array_equal(v.isel(B=1, I=2), data["V"][36:42])
+    short = {"B": data["B"], "I": data["I"], "V": data["V"][:60]}
+    v = from_data(short, ["B", "I"], ["V"], npts=6, partial="drop")["V"]
+    assert v.shape == (2, 4, 6)                     # 10 complete points
+    assert np.shares_memory(v.values, short["V"])
+    with pytest.raises(ValueError):
+        from_data(short, ["B", "I"], ["V"], npts=6, partial="crop")
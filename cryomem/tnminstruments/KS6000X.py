@@ -3,6 +3,7 @@ from struct import unpack
 import numpy as np
 import matplotlib.pyplot as plt
 from .base import Interface
+from ..common.adcdata import AdcArray
 
 
 class KS6000X(Interface):
@@ -65,9 +66,12 @@ class KS6000X(Interface):
 
         Keyword arguments:
             acquire: Bool. Default: False. Include running acquiresingle().
+            raw: Bool. Default: False. Return raw ADC codes with the scale
+                factors as an AdcArray (compact in datafiles).
         """
         acq = kwargs.get('acquire', False)
         scale = kwargs.get('scale', [1])
+        raw = kwargs.get('raw', False)
         
         if acq:
             self.acquiresingle()
@@ -75,16 +79,27 @@ class KS6000X(Interface):
                 print('Bad number of points. Re-acquiring...')
                 self.acquiresingle()
             
-        wfms = []
+        wfms, codes = [], []
         for k, c in enumerate(self.ch):
             self.write(':WAV:SOUR CHAN{}'.format(c))
             self.write(':WAV:DATA?')
             wfm0 = self.read_raw()
             print('Header:', wfm0[:10])
+            if raw:
+                codes += [np.frombuffer(wfm0[10:-1], count=self.npts,
+                    dtype=self.bo + ('i2' if self.s == 'h' else 'u2'))]
+                continue
             wfm1 = unpack('%c%d%c' % (self.bo, self.npts, self.s),
                            wfm0[10:-1])
             wfms += [((np.array(wfm1) - self.yref[c])*self.yinc[c]
                       + self.yor[c])*scale[k]]
+        if raw:
+            return AdcArray(np.array(codes).transpose(),
+                            yinc=[self.yinc[c]*scale[k]
+                                  for k, c in enumerate(self.ch)],
+                            yor=[self.yor[c]*scale[k]
+                                 for k, c in enumerate(self.ch)],
+                            yref=[self.yref[c] for c in self.ch])
         return np.array(wfms).transpose()
 
     